@@ -1,35 +1,478 @@
-import requests
 import os
 import sys
+import stat
 import subprocess
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, CancelledError
 import re
 import glob
 import signal
 import time
 import threading
 import itertools
+import json
+import hashlib
+import shutil
+import statistics
+import queue
+import argparse
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields, replace
+from typing import Optional
 
 # Set the full path to ffmpeg
 FFMPEG_PATH = r"C:\Users\veesa\Downloads\ffmpeg-2025-07-17-git-bc8d06d541-full_build\bin\ffmpeg"
 
-# Global flag for cancellation
-cancelled = False
-cancellation_lock = threading.Lock()
+# Use the same headers as the browser
+SEGMENT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': '*/*',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+    'Sec-Fetch-Dest': 'empty',
+    'Sec-Fetch-Mode': 'cors',
+    'Sec-Fetch-Site': 'cross-site',
+    'Pragma': 'no-cache',
+    'Cache-Control': 'no-cache'
+}
+DETECT_HEADERS = dict(SEGMENT_HEADERS, Referer='https://disk.yandex.com/')  # Referer is important for Yandex
+
+# Where segments are stored while downloading (None = inside the output folder),
+# e.g. a fast local SSD or tmpfs separate from the output drive
+SCRATCH_DIR = None
+# Downloads pause when the scratch drive has less free space than this
+MIN_SCRATCH_FREE_BYTES = 512 * 1024 * 1024
+
+# Name for new downloads, can use {n}, {video_id} and {date}
+FILENAME_TEMPLATE = "downloaded_{n:03d}.mp4"
+DOWNLOAD_COUNTER_FILENAME = ".yandex_download_counter"
+
+# How often the progress bar is redrawn (seconds), and whether to show a line per worker
+PROGRESS_INTERVAL = 0.5
+SHOW_WORKER_PROGRESS = False
+
+# Segments per intermediate chunk for the "chunked" merge strategy
+MERGE_GROUP_SIZE = 100
+
+@dataclass
+class Config:
+    """Settings shared by the command line, the GUI and batch mode
+    
+    Built by load_config() from, in order of priority: command line flags,
+    YANDEX_DL_* environment variables, the JSON config file, the selected
+    profile and these defaults.
+    """
+    profile: str = "default"
+    ffmpeg_path: str = field(default_factory=lambda: FFMPEG_PATH)
+    output_dir: Optional[str] = None  # None = the Downloads folder
+    scratch_dir: Optional[str] = field(default_factory=lambda: SCRATCH_DIR)
+    filename_template: str = field(default_factory=lambda: FILENAME_TEMPLATE)
+    max_segments: int = 200  # High enough to handle most videos
+    max_workers: int = 2
+    max_retries: int = 3
+    retry_delay: float = 2.0  # seconds
+    detect_timeout: float = 5.0
+    detect_delay: float = 0.1  # Pause between detection requests, so the server isn't hammered
+    segment_timeout: float = 30.0
+    chunk_size: int = 8192
+    merge_strategy: str = "stream"  # "stream" or "chunked"
+    merge_group_size: int = field(default_factory=lambda: MERGE_GROUP_SIZE)
+    min_scratch_free_mb: int = field(default_factory=lambda: MIN_SCRATCH_FREE_BYTES // (1024 * 1024))
+    hedge_requests: bool = True
+    reuse_existing: Optional[str] = "link"  # "link", "copy" or None to always download
+    progress_interval: float = field(default_factory=lambda: PROGRESS_INTERVAL)
+    show_worker_progress: bool = field(default_factory=lambda: SHOW_WORKER_PROGRESS)
+    verify_output: bool = True  # Check the merged video's duration before deleting the segments
+
+# Named sets of settings, applied on top of the defaults
+PROFILES = {
+    "default": {},
+    # Slow or unreliable connections: one transfer at a time, patient timeouts and retries
+    "low-bandwidth": {
+        "max_workers": 1,
+        "max_retries": 5,
+        "retry_delay": 5.0,
+        "detect_timeout": 15.0,
+        "segment_timeout": 90.0,
+        "chunk_size": 4096,
+        "hedge_requests": False,
+    },
+    # Fast, stable links: many parallel transfers, short timeouts, big chunks
+    "datacenter": {
+        "max_workers": 8,
+        "max_retries": 3,
+        "retry_delay": 0.5,
+        "detect_delay": 0.0,
+        "segment_timeout": 15.0,
+        "chunk_size": 65536,
+        "progress_interval": 1.0,
+    },
+    # Long recordings where completeness matters more than speed
+    "archival": {
+        "max_segments": 20000,
+        "max_retries": 10,
+        "retry_delay": 5.0,
+        "segment_timeout": 60.0,
+        "reuse_existing": "copy",
+    },
+}
+
+# Smallest allowed value of the numeric settings
+CONFIG_MINIMUMS = {
+    "max_segments": 1,
+    "max_workers": 1,
+    "max_retries": 1,
+    "chunk_size": 1,
+    "merge_group_size": 1,
+    "min_scratch_free_mb": 0,
+    "retry_delay": 0.0,
+    "detect_delay": 0.0,
+}
+# Settings that must be above zero
+CONFIG_POSITIVE = ("detect_timeout", "segment_timeout", "progress_interval")
+
+CONFIG_ENV_PREFIX = "YANDEX_DL_"
+DEFAULT_CONFIG_FILE = os.path.join(os.path.expanduser('~'), '.yandex_downloader.json')
+
+def parse_config_value(name, value):
+    """Convert a setting from a string (environment or command line) or JSON to its declared type"""
+    config_fields = {f.name: f for f in fields(Config)}
+    if name not in config_fields:
+        raise ValueError(f"Unknown setting: {name}")
+    field_type = config_fields[name].type
+    
+    if field_type is Optional[str]:
+        return None if value is None or str(value).lower() in ('', 'none', 'null') else str(value)
+    if value is None:
+        # str(None) would quietly become the setting "None"
+        raise ValueError(f"{name} can't be null")
+    if field_type is bool:
+        if isinstance(value, bool):
+            return value
+        if str(value).lower() in ('1', 'true', 'yes', 'on'):
+            return True
+        if str(value).lower() in ('0', 'false', 'no', 'off'):
+            return False
+        raise ValueError(f"{name} must be true or false, got {value!r}")
+    # int(2.7) would quietly truncate, and JSON true would become 1
+    if isinstance(value, bool) or (field_type is int and isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"{name} must be {field_type.__name__}, got {value!r}")
+    try:
+        return field_type(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"{name} must be {field_type.__name__}, got {value!r}")
+
+def check_config_ranges(config):
+    """Raise ValueError for numeric settings that are out of range, e.g. max_workers=0"""
+    for name, minimum in CONFIG_MINIMUMS.items():
+        value = getattr(config, name)
+        # Written so NaN fails the check too
+        if not value >= minimum:
+            raise ValueError(f"{name} must be at least {minimum}, got {value!r}")
+    for name in CONFIG_POSITIVE:
+        value = getattr(config, name)
+        if not value > 0:
+            raise ValueError(f"{name} must be greater than 0, got {value!r}")
+
+def load_config(config_file=None, profile=None, overrides=None, environ=None):
+    """Build the configuration from defaults, profile, config file, environment and overrides
+    
+    The config file is JSON with any Config setting, plus optionally "profile" to
+    pick a profile and "profiles" to define new ones. It is read from config_file,
+    YANDEX_DL_CONFIG or ~/.yandex_downloader.json. Raises ValueError for unknown
+    settings or profiles, for values of the wrong type or out of range and for
+    a filename_template that can't be formatted.
+    """
+    environ = os.environ if environ is None else environ
+    
+    file_values = {}
+    custom_profiles = {}
+    config_file = config_file or environ.get(CONFIG_ENV_PREFIX + "CONFIG")
+    if config_file or os.path.exists(DEFAULT_CONFIG_FILE):
+        with open(config_file or DEFAULT_CONFIG_FILE, 'r', encoding='utf-8') as f:
+            file_values = json.load(f)
+        if not isinstance(file_values, dict):
+            raise ValueError("The config file must contain a JSON object with the settings")
+        custom_profiles = file_values.pop("profiles", {})
+        if not isinstance(custom_profiles, dict) or not all(isinstance(values, dict) for values in custom_profiles.values()):
+            raise ValueError('"profiles" must map profile names to objects with settings')
+    
+    env_values = {}
+    for config_field in fields(Config):
+        key = CONFIG_ENV_PREFIX + config_field.name.upper()
+        if key in environ and config_field.name != "profile":
+            env_values[config_field.name] = environ[key]
+    
+    profile = profile or environ.get(CONFIG_ENV_PREFIX + "PROFILE") or file_values.pop("profile", None) or "default"
+    file_values.pop("profile", None)
+    profiles = dict(PROFILES, **custom_profiles)
+    if profile not in profiles:
+        raise ValueError(f"Unknown profile: {profile} (available: {', '.join(sorted(profiles))})")
+    
+    values = {}
+    for layer in (profiles[profile], file_values, env_values, overrides or {}):
+        for name, value in layer.items():
+            values[name] = parse_config_value(name, value)
+    
+    config = replace(Config(), profile=profile, **values)
+    if config.merge_strategy not in ("stream", "chunked"):
+        raise ValueError(f"merge_strategy must be 'stream' or 'chunked', got {config.merge_strategy!r}")
+    if config.reuse_existing not in (None, "link", "copy"):
+        raise ValueError(f"reuse_existing must be 'link', 'copy' or none, got {config.reuse_existing!r}")
+    check_config_ranges(config)
+    # Fails here instead of when the first download is named
+    try:
+        config.filename_template.format(n=1, video_id="video", date="2000-01-01")
+    except (KeyError, IndexError, ValueError) as e:
+        raise ValueError(f"Invalid filename_template {config.filename_template!r}: {e!r}")
+    return config
+
+def add_config_arguments(parser):
+    """Add --config, --profile and a flag for every setting (e.g. --max-workers 4) to an argparse parser"""
+    parser.add_argument("--config", metavar="FILE", help=f"JSON config file (default: {DEFAULT_CONFIG_FILE})")
+    parser.add_argument("--profile", help=f"Settings profile: {', '.join(PROFILES)} or one defined in the config file")
+    defaults = Config()
+    for config_field in fields(Config):
+        if config_field.name == "profile":
+            continue
+        parser.add_argument(
+            "--" + config_field.name.replace("_", "-"),
+            dest=config_field.name,
+            metavar="VALUE",
+            help=f"(default: {getattr(defaults, config_field.name)})"
+        )
+
+def config_from_args(args):
+    """Load the configuration, with the command line flags from add_config_arguments() on top"""
+    overrides = {
+        config_field.name: getattr(args, config_field.name)
+        for config_field in fields(Config)
+        if config_field.name != "profile" and getattr(args, config_field.name, None) is not None
+    }
+    return load_config(config_file=args.config, profile=args.profile, overrides=overrides)
+
+# Index of finished downloads, stored in the output folder
+DOWNLOAD_INDEX_FILENAME = ".yandex_download_index.json"
+
+class CancellationToken:
+    """Cancels a download job right away instead of waiting for the current chunk or retry
+    
+    Running requests are registered with the token so cancel() can cut their
+    connections, also while they still wait for the response headers, and the job
+    registers callbacks that cancel queued segments and kill ffmpeg (on a child()
+    token, so they don't outlive the job). Downloaded segments stay in the temp folder, so the same video
+    continues where it stopped the next time it is downloaded.
+    """
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.requests = set()
+        self.callbacks = []
+        self.cancelled_at = None
+    
+    def is_cancelled(self):
+        return self.event.is_set()
+    
+    def wait(self, seconds):
+        """Sleep that ends early on cancellation, returns True if cancelled"""
+        return self.event.wait(seconds)
+    
+    def cancel(self):
+        """Cancel the job, close open responses and run the cancel callbacks"""
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.cancelled_at = time.perf_counter()
+            self.event.set()
+            requests = list(self.requests)
+            callbacks = list(self.callbacks)
+        for request in requests:
+            request.abort()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+    
+    def on_cancel(self, callback):
+        """Run callback when the job is cancelled (right away if it already is)
+        
+        Returns a function that unregisters the callback again.
+        """
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                def unregister():
+                    with self.lock:
+                        if callback in self.callbacks:
+                            self.callbacks.remove(callback)
+                return unregister
+        callback()
+        return lambda: None
+    
+    @contextmanager
+    def child(self):
+        """A token for one of several jobs sharing this one, cancelled along with it
+        
+        The callbacks a job registers go away with its child token instead of
+        piling up on a token that lives as long as the program.
+        """
+        token = CancellationToken()
+        unregister = self.on_cancel(token.cancel)
+        try:
+            yield token
+        finally:
+            unregister()
+    
+    @contextmanager
+    def track(self, request):
+        """Register a RequestHandle so cancel() can cut it off, from sending it until its response is read"""
+        with self.lock:
+            self.requests.add(request)
+            cancelled = self.event.is_set()
+        if cancelled:
+            request.abort()
+        try:
+            yield request
+        finally:
+            with self.lock:
+                self.requests.discard(request)
+            request.close()
+    
+    def seconds_since_cancel(self):
+        """How long ago cancel() was called"""
+        return time.perf_counter() - self.cancelled_at if self.cancelled_at else 0.0
+
+def abort_response(response):
+    """Close a streaming response from another thread, waking up a blocked read"""
+    try:
+        # Closing alone doesn't wake a thread blocked in recv(), shutting the socket down does
+        sock = getattr(getattr(response.raw, '_connection', None), 'sock', None)
+        if sock is not None:
+            import socket
+            sock.shutdown(socket.SHUT_RDWR)
+    except Exception:
+        pass
+    try:
+        response.close()
+    except Exception:
+        pass
+
+# The RequestHandle of the request each thread is sending, picked up by the connection pool
+current_request = threading.local()
+tracking_pool_classes = None
+
+class RequestHandle:
+    """Lets another thread cut off an HTTP request at any point
+    
+    A response can only be aborted once its headers arrived, but a stuck server
+    often never sends them. Sessions prepared by track_connections() report the
+    pooled connection a request is sent on, so abort() can shut its socket down
+    while the request still waits for the response.
+    """
+    
+    def __init__(self):
+        self.connection = None
+        self.response = None
+        self.aborted = False
+        self.lock = threading.Lock()
+    
+    def get(self, session, url, **kwargs):
+        """session.get() that can be aborted, raises if abort() was called meanwhile"""
+        current_request.handle = self
+        try:
+            response = session.get(url, **kwargs)
+        finally:
+            current_request.handle = None
+        with self.lock:
+            self.response = response
+            aborted = self.aborted
+        if aborted:
+            abort_response(response)
+        return response
+    
+    def attach(self, connection):
+        """Called by the connection pool with the connection the request is sent on"""
+        with self.lock:
+            self.connection = connection
+            aborted = self.aborted
+        if aborted:
+            abort_connection(connection)
+    
+    def abort(self):
+        with self.lock:
+            self.aborted = True
+            response = self.response
+            connection = self.connection
+        if response is not None:
+            abort_response(response)
+        elif connection is not None:
+            abort_connection(connection)
+    
+    def close(self):
+        if self.response is not None:
+            self.response.close()
+
+def abort_connection(connection):
+    """Shut down the socket of a pooled connection, waking up a thread waiting for the response"""
+    sock = getattr(connection, 'sock', None)
+    if sock is not None:
+        try:
+            import socket
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+def track_connections(session):
+    """Make the connection pools of a session report their connections to RequestHandle"""
+    global tracking_pool_classes
+    if getattr(session, 'tracks_connections', False):
+        return session
+    if tracking_pool_classes is None:
+        from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+        
+        def tracking_pool(base):
+            def _get_conn(self, timeout=None):
+                connection = base._get_conn(self, timeout)
+                handle = getattr(current_request, 'handle', None)
+                if handle is not None:
+                    handle.attach(connection)
+                return connection
+            return type(f"Tracking{base.__name__}", (base,), {'_get_conn': _get_conn})
+        
+        tracking_pool_classes = {'http': tracking_pool(HTTPConnectionPool), 'https': tracking_pool(HTTPSConnectionPool)}
+    
+    for adapter in set(session.adapters.values()):
+        poolmanager = getattr(adapter, 'poolmanager', None)
+        if poolmanager is not None:
+            poolmanager.pool_classes_by_scheme = tracking_pool_classes
+            # Pools that already exist were made with the old classes
+            poolmanager.clear()
+    session.tracks_connections = True
+    return session
+
+def shutdown_now(executor):
+    """Shut an executor down without waiting for running tasks, dropping the queued ones"""
+    try:
+        executor.shutdown(wait=False, cancel_futures=True)
+    except TypeError:
+        # cancel_futures needs Python 3.9, queued tasks then see the cancelled token and return
+        executor.shutdown(wait=False)
+
+# Token of the running command line download, cancelled by Ctrl+C
+cli_cancel_token = None
 
 def signal_handler(signum, frame):
     """Handle Ctrl+C gracefully"""
-    global cancelled
-    with cancellation_lock:
-        cancelled = True
+    if cli_cancel_token is None or cli_cancel_token.is_cancelled():
+        # Nothing to cancel yet, or a second Ctrl+C: stop right away
+        raise KeyboardInterrupt
     print("\n\n⚠️  Cancellation requested! Stopping download...")
-    print("🛑 Download cancelled by user!")
-    # Force exit after a short delay to allow message to display
-    time.sleep(0.5)
-    sys.exit(0)
-
-# Register signal handler for Ctrl+C
-signal.signal(signal.SIGINT, signal_handler)
+    # Cancel from another thread, the handler may have interrupted code holding the token's lock
+    threading.Thread(target=cli_cancel_token.cancel, daemon=True).start()
 
 def get_default_downloads_folder():
     """Get the default downloads folder based on the user's OS."""
@@ -47,28 +490,226 @@ def get_default_downloads_folder():
     else:  # macOS, Linux, etc.
         return os.path.join(os.path.expanduser('~'), 'Downloads')
 
-def get_next_filename(output_path):
-    """Get the next available filename in sequence (downloaded_001.mp4, downloaded_002.mp4, etc.)"""
-    pattern = os.path.join(output_path, "downloaded_*.mp4")
-    existing_files = glob.glob(pattern)
+def break_stale_lock(lock_file, stale_after):
+    """Remove a lock left behind by a crashed job
     
-    if not existing_files:
-        return "downloaded_001.mp4"
-    
-    # Extract numbers from existing filenames
-    numbers = []
-    for file in existing_files:
-        filename = os.path.basename(file)
-        match = re.search(r'downloaded_(\d+)\.mp4', filename)
+    The lock is first renamed to a name only this thread uses, so of several
+    waiters that all saw the stale lock only one gets it. If the renamed lock
+    turns out to be fresh, another waiter broke the stale one and took the lock
+    in the meantime, and it is put back.
+    """
+    broken_file = f"{lock_file}.{os.getpid()}.{threading.get_ident()}.broken"
+    os.rename(lock_file, broken_file)
+    if time.time() - os.path.getmtime(broken_file) > stale_after:
+        os.remove(broken_file)
+        return
+    try:
+        # Hardlinking never replaces a lock someone took since
+        os.link(broken_file, lock_file)
+    except OSError:
+        pass
+    os.remove(broken_file)
+
+@contextmanager
+def file_lock(lock_file, timeout=10, stale_after=30):
+    """Hold an exclusive lock on lock_file, shared between threads and processes"""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            break
+        except FileExistsError:
+            # A crashed job can leave the lock behind, so old locks are broken
+            try:
+                if time.time() - os.path.getmtime(lock_file) > stale_after:
+                    break_stale_lock(lock_file, stale_after)
+                    continue
+            except OSError:
+                continue
+            if time.time() > deadline:
+                raise TimeoutError(f"Could not lock {lock_file}")
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(lock_file)
+        except OSError:
+            pass
+
+def find_highest_download_number(output_path):
+    """Find the highest number used by downloaded_*.mp4 files (only needed once per folder)"""
+    numbers = [0]
+    for file in glob.glob(os.path.join(output_path, "downloaded_*.mp4")):
+        match = re.search(r'downloaded_(\d+)\.mp4', os.path.basename(file))
         if match:
             numbers.append(int(match.group(1)))
+    return max(numbers)
+
+def clean_filename_part(value):
+    """Remove characters that are not allowed in filenames"""
+    value = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '_', str(value)).strip(' .')
+    return value[:100] or "video"
+
+def get_next_filename(output_path, template=None, video_id=None):
+    """Get the next available filename in sequence (downloaded_001.mp4, downloaded_002.mp4, etc.)
+    
+    The number comes from a counter file in the output folder that is updated under
+    a lock, so concurrent jobs never get the same name and the folder is not scanned
+    every time. The template can use {n}, {video_id} and {date}.
+    
+    The name is reserved by creating an empty file while the lock is held, so
+    concurrent jobs never get the same name even with templates without {n}.
+    download_video_from_pattern() writes the video over it, or removes it if the
+    job fails. Raises OSError if the folder can't be written or the lock can't
+    be taken.
+    """
+    if template is None:
+        template = FILENAME_TEMPLATE
+    os.makedirs(output_path, exist_ok=True)
+    counter_file = os.path.join(output_path, DOWNLOAD_COUNTER_FILENAME)
+    
+    with file_lock(counter_file + ".lock"):
+        try:
+            with open(counter_file, 'r') as f:
+                last_num = int(f.read().strip())
+        except (OSError, ValueError):
+            # First run in this folder, continue after any existing downloads
+            last_num = find_highest_download_number(output_path)
+        
+        fields = {
+            'video_id': clean_filename_part(video_id or "video"),
+            'date': time.strftime('%Y-%m-%d'),
+        }
+        def format_name(num):
+            filename = template.format(n=num, **fields)
+            return filename if filename.endswith('.mp4') else filename + '.mp4'
+        
+        next_num = last_num + 1
+        filename = format_name(next_num)
+        
+        # Only loops if files were added by hand or the template doesn't use {n}
+        stem = os.path.splitext(filename)[0]
+        suffix = 2
+        while True:
+            try:
+                os.close(os.open(os.path.join(output_path, filename), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                pass
+            if '{n' in template:
+                next_num += 1
+                filename = format_name(next_num)
+            else:
+                filename = f"{stem}_{suffix}.mp4"
+                suffix += 1
+        
+        with open(counter_file, 'w') as f:
+            f.write(str(next_num))
+    
+    return filename
+
+def extract_base_url(url):
+    """Turn a pasted segment URL into the URL of segment 0, or None if it has no segment pattern"""
+    if "0.ts" in url:
+        return url
+    # Try to find the pattern
+    match = re.search(r'(https?://[^?]+)0\.ts([^?]*\?.*)', url)
+    if match:
+        return match.group(1) + "0.ts" + match.group(2)
+    return None
+
+def get_video_id(base_url):
+    """Get a stable id for a video from its segment URL (the vid parameter, or the path without the segment number)"""
+    parts = urlsplit(base_url)
+    vid = parse_qs(parts.query).get('vid')
+    if vid and vid[0]:
+        return vid[0]
+    # Tokens in the query string expire, so only use the path
+    return re.sub(r'0\.ts$', '', parts.netloc + parts.path)
+
+def file_sha256(filepath, chunk_size=1024 * 1024):
+    """Hash a file in chunks so large videos don't need to fit in memory"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_download_index(output_path):
+    """Load the index of finished downloads for an output folder"""
+    index_file = os.path.join(output_path, DOWNLOAD_INDEX_FILENAME)
+    try:
+        with open(index_file, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        return index if isinstance(index, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def save_download_index(output_path, index):
+    """Write the download index atomically so a crash never leaves it half-written"""
+    index_file = os.path.join(output_path, DOWNLOAD_INDEX_FILENAME)
+    tmp_file = f"{index_file}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_file, index_file)
+
+def record_download(output_path, video_id, segment_count, total_bytes, output_file):
+    """Remember a finished download so the same video can be skipped next time"""
+    entry = {
+        'video_id': video_id,
+        'segments': segment_count,
+        'total_bytes': total_bytes,
+        'size': os.path.getsize(output_file),
+        'sha256': file_sha256(output_file),
+        'path': os.path.abspath(output_file),
+    }
+    # Locked across processes, so concurrent jobs never drop each other's entries
+    with file_lock(os.path.join(output_path, DOWNLOAD_INDEX_FILENAME + ".lock")):
+        index = load_download_index(output_path)
+        index[video_id] = entry
+        save_download_index(output_path, index)
+    return entry
+
+def find_existing_download(output_path, video_id):
+    """Return the index entry for an already downloaded video, or None if it is missing or was changed"""
+    # No lock needed, the index is always replaced as a whole
+    entry = load_download_index(output_path).get(video_id)
+    if not entry:
+        return None
     
-    if not numbers:
-        return "downloaded_001.mp4"
+    path = entry.get('path')
+    try:
+        # Cheap size check first, the hash is only computed if the size matches
+        if not path or os.path.getsize(path) != entry.get('size'):
+            return None
+        if file_sha256(path) != entry.get('sha256'):
+            return None
+    except OSError:
+        return None
+    return entry
+
+def reuse_existing_download(existing_path, output_file, mode="link"):
+    """Make an existing download available as output_file by hardlinking or copying it"""
+    if os.path.abspath(existing_path) == os.path.abspath(output_file):
+        return output_file
+    if os.path.exists(output_file):
+        # Only the empty file reserved by get_next_filename() may be replaced
+        if os.path.getsize(output_file) > 0:
+            return None
+        os.remove(output_file)
     
-    # Find the next number
-    next_num = max(numbers) + 1
-    return f"downloaded_{next_num:03d}.mp4"
+    if mode == "link":
+        try:
+            os.link(existing_path, output_file)
+            return output_file
+        except OSError:
+            # Different drive or filesystem without hardlinks, fall back to copying
+            pass
+    shutil.copy2(existing_path, output_file)
+    return output_file
 
 def print_progress_bar(current, total, prefix="Progress", suffix="Complete", length=50, fill="█"):
     """Print a modern progress bar like pip installations with color"""
@@ -96,23 +737,172 @@ def print_progress_bar(current, total, prefix="Progress", suffix="Complete", len
     if current == total:
         print()
 
-def detect_segment_count(base_url, session, max_limit=None):
-    """Detect how many segments are actually available using a super conservative approach"""
+def format_duration(seconds):
+    """Format seconds as m:ss or h:mm:ss"""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+class ProgressTracker:
+    """Byte level download progress with a smoothed rate and ETA
+    
+    Workers report bytes from the chunk loop as they arrive, so the rate is known
+    long before whole segments finish, even when they finish out of order. A
+    reporter thread redraws the progress bar at a fixed interval instead of on
+    every chunk, with an optional line per worker below it.
+    """
+    
+    def __init__(self, total_segments, estimated_total_bytes=None, prefix="Downloading", interval=0.5, smoothing=0.3, show_workers=False):
+        self.total_segments = total_segments
+        self.estimated_total_bytes = estimated_total_bytes
+        self.prefix = prefix
+        self.interval = interval
+        self.smoothing = smoothing
+        self.show_workers = show_workers
+        self.bytes = 0
+        self.completed = 0
+        self.succeeded = 0
+        self.segment_bytes = 0  # size of the segments that finished, used to refine the estimate
+        self.workers = {}  # thread name -> [segment index, bytes, start time]
+        self.rate = None
+        self.last_bytes = 0
+        self.last_time = None
+        self.worker_lines = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+    
+    def start(self):
+        self.last_time = time.perf_counter()
+        self.thread = threading.Thread(target=self.report, daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        """Stop the reporter and draw the final state"""
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        self.update_rate()
+        self.render()
+    
+    def start_segment(self, index):
+        with self.lock:
+            self.workers[threading.current_thread().name] = [index, 0, time.perf_counter()]
+    
+    def add_bytes(self, count, measured=True):
+        """Called from the chunk loop for every chunk written
+        
+        Bytes that were not just downloaded (segments kept from an earlier run,
+        or a negative count for a failed attempt) pass measured=False, they
+        change the total without showing up in the rate.
+        """
+        with self.lock:
+            self.bytes += count
+            if not measured:
+                self.last_bytes += count
+            worker = self.workers.get(threading.current_thread().name)
+            if worker:
+                worker[1] += count
+    
+    def segment_done(self, success, size=0):
+        with self.lock:
+            self.completed += 1
+            if success:
+                self.succeeded += 1
+                self.segment_bytes += size
+    
+    def end_segment(self):
+        with self.lock:
+            self.workers.pop(threading.current_thread().name, None)
+    
+    def update_rate(self):
+        """Blend the rate since the last update into the exponentially weighted average"""
+        now = time.perf_counter()
+        with self.lock:
+            elapsed = now - self.last_time
+            if elapsed <= 0:
+                return
+            instant_rate = (self.bytes - self.last_bytes) / elapsed
+            self.last_bytes = self.bytes
+            self.last_time = now
+            if self.rate is None:
+                self.rate = instant_rate
+            else:
+                self.rate = self.smoothing * instant_rate + (1 - self.smoothing) * self.rate
+    
+    def total_bytes_estimate(self):
+        """Expected size of the whole video, from finished segments once there are any"""
+        if self.succeeded:
+            return self.segment_bytes / self.succeeded * self.total_segments
+        return self.estimated_total_bytes
+    
+    def eta(self):
+        total = self.total_bytes_estimate()
+        if not total or not self.rate:
+            return None
+        return max(total - self.bytes, 0) / self.rate
+    
+    def report(self):
+        while not self.stopped.wait(self.interval):
+            self.update_rate()
+            self.render()
+    
+    def render(self):
+        """Draw the progress bar (and worker lines) once"""
+        with self.lock:
+            completed = self.completed
+            success_rate = self.succeeded / completed * 100 if completed else 0
+            mb_downloaded = self.bytes / (1024 * 1024)
+            workers = sorted(self.workers.items())
+        rate = f"{(self.rate or 0) / (1024 * 1024):.2f} MB/s"
+        eta = self.eta()
+        eta_text = format_duration(eta) if eta is not None else "--:--"
+        
+        # Move back over the worker lines drawn last time
+        if self.worker_lines:
+            print(f"\033[{self.worker_lines}A", end='')
+        print_progress_bar(
+            completed, self.total_segments,
+            prefix=self.prefix,
+            suffix=f"({completed}/{self.total_segments}, {mb_downloaded:.1f}MB, {rate}, ETA {eta_text}, {success_rate:.1f}% success)"
+        )
+        
+        if self.show_workers:
+            now = time.perf_counter()
+            lines = []
+            for name, (index, count, started) in workers:
+                worker_rate = count / (now - started) / 1024 if now > started else 0
+                lines.append(f"   ⛏️  {name}: segment {index}, {count / 1024:.0f} KB at {worker_rate:.0f} KB/s")
+            # Pad so lines of workers that finished are cleared
+            lines += [""] * (self.worker_lines - len(lines))
+            for line in lines:
+                print(f"\n\033[K{line}", end='')
+            self.worker_lines = len(lines)
+            if completed == self.total_segments:
+                print()
+                self.worker_lines = 0
+            print('', end='', flush=True)
+
+def content_length(response):
+    """Size of a response body from its Content-Length, or None if the server doesn't say"""
+    try:
+        return int(response.headers['Content-Length'])
+    except (KeyError, ValueError):
+        return None
+
+def detect_segment_count(base_url, session, max_limit=None, cancel_token=None, config=None, sizes=None):
+    """Detect how many segments are actually available using a super conservative approach
+    
+    If sizes is a dict, the Content-Length of every segment found is stored in it
+    by index, so the size of the video can be estimated without more requests.
+    """
     print("🔍 Detecting available segments...")
     
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': '*/*',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-        'Sec-Fetch-Dest': 'empty',
-        'Sec-Fetch-Mode': 'cors',
-        'Sec-Fetch-Site': 'cross-site',
-        'Pragma': 'no-cache',
-        'Cache-Control': 'no-cache',
-        'Referer': 'https://disk.yandex.com/'  # Important for Yandex
-    }
+    if config is None:
+        config = Config()
+    
+    headers = DETECT_HEADERS
     
     # Spinner animation - use simpler characters that work better in GUI
     spinner = itertools.cycle(['⠋', '⠙', '⠹', '⠸', '⠼', '⠴', '⠦', '⠧', '⠇', '⠏'])
@@ -122,11 +912,13 @@ def detect_segment_count(base_url, session, max_limit=None):
     segment_url = base_url
     try:
         print(f"\r{next(spinner)} 🔍 Verifying first segment...", end="", flush=True)
-        response = session.get(segment_url, headers=headers, timeout=10, stream=True)
+        response = session.get(segment_url, headers=headers, timeout=max(10, config.detect_timeout), stream=True)
         if response.status_code != 200:
             print(f"\r{' ' * 80}")
             print("❌ First segment not found! URL may be invalid.")
             return 0
+        if sizes is not None:
+            sizes[0] = content_length(response)
         
         # Read a small part to verify it's a valid segment
         for chunk in response.iter_content(chunk_size=8192):
@@ -138,18 +930,19 @@ def detect_segment_count(base_url, session, max_limit=None):
         print(f"❌ Error accessing first segment: {str(e)}")
         return 0
     
-    # Default to 200 segments if max_limit is not specified
-    # This allows for checking many more segments by default
-    max_to_check = 200 if max_limit is None else max_limit
+    # Default to the configured maximum if max_limit is not specified
+    max_to_check = config.max_segments if max_limit is None else max_limit
     
     # Check segments sequentially
     for i in range(max_to_check):
+        if cancel_token and cancel_token.is_cancelled():
+            break
         segment_url = base_url.replace("0.ts", f"{i}.ts")
         try:
             print(f"\r{next(spinner)} 🔍 Checking segment {i}...", end="", flush=True)
             
             # Use GET instead of HEAD to be more accurate (some servers respond differently)
-            response = session.get(segment_url, headers=headers, timeout=5, stream=True)
+            response = session.get(segment_url, headers=headers, timeout=config.detect_timeout, stream=True)
             
             if response.status_code == 200:
                 # Verify it's actually a valid segment by reading a small part
@@ -161,6 +954,8 @@ def detect_segment_count(base_url, session, max_limit=None):
                 
                 if is_valid:
                     found_segments = i + 1
+                    if sizes is not None:
+                        sizes[i] = content_length(response)
                 else:
                     # We found a response but it's not a valid segment
                     break
@@ -169,7 +964,12 @@ def detect_segment_count(base_url, session, max_limit=None):
                 break
                 
             # Don't hammer the server
-            time.sleep(0.1)
+            if not config.detect_delay:
+                continue
+            if cancel_token:
+                cancel_token.wait(config.detect_delay)
+            else:
+                time.sleep(config.detect_delay)
             
         except Exception as e:
             # Error means we've likely reached the end
@@ -180,69 +980,283 @@ def detect_segment_count(base_url, session, max_limit=None):
     print(f"✅ Found {found_segments} segments available")
     return found_segments
 
+class SegmentTransfer:
+    """State of one segment download, shared by the original request and its hedge"""
+    
+    def __init__(self, index, url, filepath):
+        self.index = index
+        self.url = url
+        self.filepath = filepath
+        self.started = None
+        self.bytes = 0
+        self.request = None  # RequestHandle of the current attempt
+        self.hedge_request = None
+        self.hedge_future = None
+        self.winner = None  # "primary" or "hedge" once one of them has finished
+        self.lock = threading.Lock()
+    
+    def claim(self, who):
+        """Try to become the request whose file is kept, only the first one succeeds"""
+        with self.lock:
+            if self.winner is None:
+                self.winner = who
+                return True
+            return False
+
+class HedgeMonitor:
+    """Sends a second request for segments that are much slower than the rest
+    
+    One stuck connection can hold up the whole video, since the job finishes only
+    when its slowest segment does. A watcher thread compares each running transfer
+    to the segments that already finished; when one takes longer than the latency
+    percentile or its rate falls far below the median, the same segment is requested
+    again on another connection and whichever finishes first is kept.
+    """
+    
+    def __init__(self, session, cancel_token, min_samples=5, latency_percentile=95, slow_factor=4.0, min_elapsed=1.0, max_hedges=2, timeout=30, chunk_size=8192):
+        self.session = session
+        self.cancel_token = cancel_token
+        self.min_samples = min_samples
+        self.latency_percentile = latency_percentile
+        self.slow_factor = slow_factor
+        self.min_elapsed = min_elapsed
+        self.active = {}  # index -> SegmentTransfer
+        self.durations = deque(maxlen=200)  # seconds per finished segment
+        self.rates = deque(maxlen=200)  # bytes per second per finished segment
+        self.launched = 0
+        self.won = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=max_hedges)
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.max_hedges = max_hedges
+        self.running_hedges = 0
+        self.thread = None
+    
+    def start(self):
+        self.thread = threading.Thread(target=self.watch, daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        """Stop watching and wait for running hedges (not when the job was cancelled)"""
+        with self.lock:
+            self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        if self.cancel_token.is_cancelled():
+            shutdown_now(self.executor)
+        else:
+            self.executor.shutdown(wait=True)
+    
+    def begin(self, index, url, filepath):
+        transfer = SegmentTransfer(index, url, filepath)
+        with self.lock:
+            self.active[index] = transfer
+        return transfer
+    
+    def end(self, transfer):
+        with self.lock:
+            self.active.pop(transfer.index, None)
+    
+    def record(self, transfer):
+        """Remember how long a finished segment took, used to spot slow ones"""
+        duration = time.perf_counter() - transfer.started
+        with self.lock:
+            self.durations.append(duration)
+            if duration > 0:
+                self.rates.append(transfer.bytes / duration)
+    
+    def watch(self):
+        while not self.stopped.wait(0.25):
+            self.check()
+    
+    def check(self):
+        """Hedge every running transfer that is far slower than the finished ones"""
+        with self.lock:
+            if len(self.durations) < self.min_samples:
+                return
+            durations = sorted(self.durations)
+            latency_limit = durations[min(len(durations) - 1, len(durations) * self.latency_percentile // 100)]
+            median_rate = statistics.median(self.rates) if self.rates else 0
+            transfers = list(self.active.values())
+        
+        now = time.perf_counter()
+        for transfer in transfers:
+            if transfer.started is None or transfer.hedge_future or transfer.winner:
+                continue
+            elapsed = now - transfer.started
+            if elapsed < self.min_elapsed:
+                continue
+            rate = transfer.bytes / elapsed
+            if elapsed > latency_limit or rate < median_rate / self.slow_factor:
+                # Submitted under the lock, so stop() can't shut the executor down in between
+                with self.lock:
+                    if self.running_hedges >= self.max_hedges or self.stopped.is_set():
+                        return
+                    self.running_hedges += 1
+                    self.launched += 1
+                    transfer.hedge_future = self.executor.submit(self.run_hedge, transfer)
+    
+    def run_hedge(self, transfer):
+        """Download the segment again, returns its path if this request finished first"""
+        hedge_filepath = transfer.filepath + ".hedge"
+        try:
+            request = transfer.hedge_request = RequestHandle()
+            with self.cancel_token.track(request):
+                response = request.get(self.session, transfer.url, headers=SEGMENT_HEADERS, stream=True, timeout=self.timeout)
+                response.raise_for_status()
+                with open(hedge_filepath, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        if transfer.winner:
+                            return None
+                        if chunk:
+                            f.write(chunk)
+            
+            if os.path.getsize(hedge_filepath) < 1000 or not transfer.claim("hedge"):
+                return None
+            os.replace(hedge_filepath, transfer.filepath)
+            with self.lock:
+                self.won += 1
+            # The original request lost, cut it off even if it is still waiting for a response
+            if transfer.request is not None:
+                transfer.request.abort()
+            return transfer.filepath
+        except Exception:
+            return None
+        finally:
+            with self.lock:
+                self.running_hedges -= 1
+            if os.path.exists(hedge_filepath):
+                try:
+                    os.remove(hedge_filepath)
+                except OSError:
+                    pass
+    
+    def summary(self):
+        """One line report of the hedged requests"""
+        return f"{self.launched} launched, {self.won} finished first, {self.launched - self.won} not needed"
+
 def download_segment_with_retry(args):
     """Download a single segment with retry logic"""
-    global cancelled
+    index, url, temp_dir, session, cancel_token, space_guard, hedger, progress, config = args
     
     # Check if cancelled
-    with cancellation_lock:
-        if cancelled:
-            return None
-        
-    index, url, temp_dir, session = args
+    if cancel_token.is_cancelled():
+        return None
+    
     filename = f"segment_{index:05d}.ts"
     filepath = os.path.join(temp_dir, filename)
     
     # Skip if already downloaded and has content
     if os.path.exists(filepath) and os.path.getsize(filepath) > 1000:
+        if progress:
+            progress.add_bytes(os.path.getsize(filepath), measured=False)
         return filepath
     
+    if progress:
+        progress.start_segment(index)
+    transfer = hedger.begin(index, url, filepath) if hedger else None
+    try:
+        result = fetch_segment(index, url, filepath, session, cancel_token, space_guard, transfer, hedger, progress, config)
+    finally:
+        if hedger:
+            hedger.end(transfer)
+        if progress:
+            progress.end_segment()
+    
+    if transfer is None:
+        return result
+    
+    # If a hedged request was started it may have won, or may still succeed where this one failed
+    if transfer.hedge_future and (transfer.winner == "hedge" or result is None):
+        try:
+            result = transfer.hedge_future.result() or result
+        except CancelledError:
+            pass
+        # The hedged request doesn't report its chunks, count the file it kept
+        if result and transfer.winner == "hedge" and progress:
+            progress.add_bytes(os.path.getsize(result), measured=False)
+    return result
+
+def fetch_segment(index, url, filepath, session, cancel_token, space_guard, transfer=None, hedger=None, progress=None, config=None):
+    """Download a segment to filepath, retrying failed attempts"""
+    # requests is imported lazily, it is the slowest import and only needed for downloading
+    import requests
+    
+    # Written under a temporary name so a cancelled download never looks complete
+    part_filepath = filepath + ".part"
+    
     # Retry logic
-    max_retries = 3
-    retry_delay = 2  # seconds
+    if config is None:
+        config = Config()
+    max_retries = config.max_retries
+    retry_delay = config.retry_delay  # seconds
     
     for attempt in range(max_retries):
+        # Wait while the scratch drive is too full, the merge frees space meanwhile
+        if space_guard and not space_guard.wait_for_space(index, cancel_token):
+            return None
+        
         # Check cancellation before each attempt
-        with cancellation_lock:
-            if cancelled:
-                return None
+        if cancel_token.is_cancelled():
+            return None
+        
+        # A hedged request already finished this segment
+        if transfer and transfer.winner:
+            return None
         
+        if transfer and transfer.started is None:
+            transfer.started = time.perf_counter()
+        
+        # Bytes of this attempt, taken back out of the progress if it fails
+        attempt_bytes = 0
+        kept = False
         try:
-            # Use the same headers as the browser
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': '*/*',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Connection': 'keep-alive',
-                'Sec-Fetch-Dest': 'empty',
-                'Sec-Fetch-Mode': 'cors',
-                'Sec-Fetch-Site': 'cross-site',
-                'Pragma': 'no-cache',
-                'Cache-Control': 'no-cache'
-            }
-            
-            response = session.get(url, headers=headers, stream=True, timeout=30)
-            response.raise_for_status()
+            request = RequestHandle()
+            if transfer:
+                transfer.request = request
+            with cancel_token.track(request):
+                response = request.get(session, url, headers=SEGMENT_HEADERS, stream=True, timeout=config.segment_timeout)
+                response.raise_for_status()
+                
+                with open(part_filepath, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=config.chunk_size):
+                        if chunk:
+                            f.write(chunk)
+                            if transfer:
+                                transfer.bytes += len(chunk)
+                            attempt_bytes += len(chunk)
+                            if progress:
+                                progress.add_bytes(len(chunk))
             
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+            if cancel_token.is_cancelled():
+                return None
                         
             # Check if file is valid
-            if os.path.getsize(filepath) < 1000:
+            if os.path.getsize(part_filepath) < 1000:
                 if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
+                    cancel_token.wait(retry_delay)
                     continue
                 return None
-                
+            
+            if transfer:
+                # A hedged request that already finished keeps its file instead
+                if not transfer.claim("primary"):
+                    os.remove(part_filepath)
+                    return None
+                if transfer.hedge_request is not None:
+                    transfer.hedge_request.abort()
+                hedger.record(transfer)
+            
+            os.replace(part_filepath, filepath)
+            kept = True
             return filepath
             
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 524:
                 if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
+                    cancel_token.wait(retry_delay)
                     continue
                 else:
                     return None
@@ -250,37 +1264,735 @@ def download_segment_with_retry(args):
                 return None
             else:
                 if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
+                    cancel_token.wait(retry_delay)
                     continue
                 return None
         except Exception as e:
+            # Cut off because a hedged request finished first
+            if transfer and transfer.winner == "hedge":
+                return None
             if attempt < max_retries - 1:
-                time.sleep(retry_delay)
+                cancel_token.wait(retry_delay)
                 continue
             return None
+        finally:
+            if progress and attempt_bytes and not kept:
+                progress.add_bytes(-attempt_bytes, measured=False)
     
     return None
 
-def download_video_from_pattern(base_url, max_segments, output_filename=None):
-    """Download video using the TS segment pattern with automatic detection"""
-    global cancelled
+class ScratchSpaceGuard:
+    """Pauses downloading while the scratch drive is low on space
+    
+    While space is low the merger deletes segments as soon as they are merged,
+    and only the segments the merge is waiting for are downloaded, so the job
+    keeps moving instead of failing with a full disk.
+    """
+    
+    def __init__(self, scratch_dir, min_free_bytes, merger):
+        self.scratch_dir = scratch_dir
+        self.min_free_bytes = min_free_bytes
+        self.merger = merger
+        self.warned = False
+    
+    def free_bytes(self):
+        return shutil.disk_usage(self.scratch_dir).free
+    
+    def wait_for_space(self, index, cancel_token):
+        """Block until there is enough space for this segment, returns False if cancelled"""
+        while self.free_bytes() < self.min_free_bytes and not self.merger.needs_segment(index):
+            if not self.warned:
+                self.warned = True
+                self.merger.drain_segments = True
+                print(f"\n⚠️ Low disk space in {self.scratch_dir}, pausing downloads until the merge catches up")
+            if cancel_token.wait(0.1):
+                return False
+        return not cancel_token.is_cancelled()
+
+def ts_duration(filepath):
+    """Duration of an MPEG-TS segment in seconds, read from its video (or audio) timestamps
+    
+    Returns None if the file has no usable timestamps.
+    """
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    
+    timestamps = {'video': [], 'audio': []}
+    for offset in range(0, len(data) - 187, 188):
+        packet = data[offset:offset + 188]
+        # Sync byte, and only packets where a new PES packet starts
+        if packet[0] != 0x47 or not packet[1] & 0x40:
+            continue
+        adaptation = (packet[3] >> 4) & 0x3
+        if adaptation == 2:  # Adaptation field only, no payload
+            continue
+        start = 4 + (1 + packet[4] if adaptation == 3 else 0)
+        pes = packet[start:]
+        if len(pes) < 14 or pes[:3] != b'\x00\x00\x01' or not pes[7] & 0x80:
+            continue
+        
+        stream_id = pes[3]
+        kind = 'video' if 0xE0 <= stream_id <= 0xEF else 'audio' if 0xC0 <= stream_id <= 0xDF else None
+        if kind:
+            p = pes[9:14]
+            pts = ((p[0] >> 1) & 0x07) << 30 | p[1] << 22 | (p[2] >> 1) << 15 | p[3] << 7 | p[4] >> 1
+            timestamps[kind].append(pts)
+    
+    values = timestamps['video'] if len(timestamps['video']) > 1 else timestamps['audio']
+    if len(values) < 2:
+        return None
+    # Timestamps run at 90 kHz, the last frame lasts about as long as the average frame
+    span = max(values) - min(values)
+    return (span + span / (len(values) - 1)) / 90000
+
+def mp4_boxes(data, start=0, end=None):
+    """Yield (type, payload start, box end) for the MP4 boxes in data[start:end]"""
+    end = len(data) if end is None else end
+    while start + 8 <= end:
+        size = int.from_bytes(data[start:start + 4], 'big')
+        header_size = 8
+        if size == 1:
+            size = int.from_bytes(data[start + 8:start + 16], 'big')
+            header_size = 16
+        elif size == 0:
+            size = end - start
+        if size < header_size or start + size > end:
+            return
+        yield data[start + 4:start + 8], start + header_size, start + size
+        start += size
+
+def mp4_child(data, start, end, box_type):
+    """Payload start and end of the first child box of a type, or None"""
+    for child_type, payload, child_end in mp4_boxes(data, start, end):
+        if child_type == box_type:
+            return payload, child_end
+    return None
+
+def mp4_timescale_duration(data, payload):
+    """Timescale and duration from an mvhd or mdhd box"""
+    if data[payload] == 1:
+        return int.from_bytes(data[payload + 20:payload + 24], 'big'), int.from_bytes(data[payload + 24:payload + 32], 'big')
+    return int.from_bytes(data[payload + 12:payload + 16], 'big'), int.from_bytes(data[payload + 16:payload + 20], 'big')
+
+def mp4_fragment_ends(moof, default_durations, decode_times):
+    """Add up the sample durations of one moof box, updating the decode time per track id"""
+    for box_type, traf, traf_end in mp4_boxes(moof):
+        if box_type != b'traf':
+            continue
+        tfhd = mp4_child(moof, traf, traf_end, b'tfhd')
+        if not tfhd:
+            continue
+        flags = int.from_bytes(moof[tfhd[0] + 1:tfhd[0] + 4], 'big')
+        track_id = int.from_bytes(moof[tfhd[0] + 4:tfhd[0] + 8], 'big')
+        offset = tfhd[0] + 8 + (8 if flags & 0x1 else 0) + (4 if flags & 0x2 else 0)
+        default_duration = int.from_bytes(moof[offset:offset + 4], 'big') if flags & 0x8 else default_durations.get(track_id, 0)
+        
+        tfdt = mp4_child(moof, traf, traf_end, b'tfdt')
+        if tfdt:
+            size = 8 if moof[tfdt[0]] == 1 else 4
+            decode_times[track_id] = int.from_bytes(moof[tfdt[0] + 4:tfdt[0] + 4 + size], 'big')
+        
+        for child_type, trun, _ in mp4_boxes(moof, traf, traf_end):
+            if child_type != b'trun':
+                continue
+            flags = int.from_bytes(moof[trun + 1:trun + 4], 'big')
+            sample_count = int.from_bytes(moof[trun + 4:trun + 8], 'big')
+            offset = trun + 8 + (4 if flags & 0x1 else 0) + (4 if flags & 0x4 else 0)
+            sample_size = 4 * bin(flags & 0xF00).count('1')
+            if flags & 0x100:
+                duration = sum(
+                    int.from_bytes(moof[offset + i * sample_size:offset + i * sample_size + 4], 'big')
+                    for i in range(sample_count)
+                )
+            else:
+                duration = default_duration * sample_count
+            decode_times[track_id] = decode_times.get(track_id, 0) + duration
+
+def mp4_info(filepath):
+    """Duration and tracks of an MP4 file, read from its moov box without ffprobe
+    
+    Fragmented MP4 (live streams) has no duration in moov, there the sample
+    durations of the moof boxes are added up. Returns {'duration': seconds,
+    'tracks': [{'id', 'type', 'timescale', 'duration'}]}, or None if the file is not a complete MP4.
+    """
+    moov = None
+    fragments = []
+    file_size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as f:
+        # Walk the top level boxes by seeking, mdat holds the whole video and is never read
+        offset = 0
+        while offset + 8 <= file_size:
+            f.seek(offset)
+            header = f.read(16)
+            size = int.from_bytes(header[:4], 'big')
+            header_size = 8
+            if size == 1:
+                size = int.from_bytes(header[8:16], 'big')
+                header_size = 16
+            elif size == 0:
+                size = file_size - offset
+            if size < header_size or offset + size > file_size:
+                # Truncated file
+                return None
+            if header[4:8] in (b'moov', b'moof'):
+                f.seek(offset + header_size)
+                data = f.read(size - header_size)
+                if header[4:8] == b'moov':
+                    moov = data
+                else:
+                    fragments.append(data)
+            offset += size
+    if moov is None:
+        return None
+    
+    mvhd = mp4_child(moov, 0, len(moov), b'mvhd')
+    if not mvhd:
+        return None
+    timescale, duration = mp4_timescale_duration(moov, mvhd[0])
+    
+    tracks = []
+    for box_type, trak, trak_end in mp4_boxes(moov):
+        if box_type != b'trak':
+            continue
+        tkhd = mp4_child(moov, trak, trak_end, b'tkhd')
+        mdia = mp4_child(moov, trak, trak_end, b'mdia')
+        if not tkhd or not mdia:
+            continue
+        mdhd = mp4_child(moov, mdia[0], mdia[1], b'mdhd')
+        hdlr = mp4_child(moov, mdia[0], mdia[1], b'hdlr')
+        if not mdhd or not hdlr:
+            continue
+        track_id_offset = tkhd[0] + (20 if moov[tkhd[0]] == 1 else 12)
+        handler = moov[hdlr[0] + 8:hdlr[0] + 12]
+        track_timescale, track_duration = mp4_timescale_duration(moov, mdhd[0])
+        tracks.append({
+            'id': int.from_bytes(moov[track_id_offset:track_id_offset + 4], 'big'),
+            'type': {b'vide': 'video', b'soun': 'audio'}.get(handler, handler.decode('latin-1')),
+            'timescale': track_timescale,
+            'duration': track_duration / track_timescale if track_timescale else 0.0,
+        })
+    
+    if fragments:
+        default_durations = {}
+        mvex = mp4_child(moov, 0, len(moov), b'mvex')
+        if mvex:
+            for box_type, trex, _ in mp4_boxes(moov, mvex[0], mvex[1]):
+                if box_type == b'trex':
+                    track_id = int.from_bytes(moov[trex + 4:trex + 8], 'big')
+                    default_durations[track_id] = int.from_bytes(moov[trex + 12:trex + 16], 'big')
+        decode_times = {}
+        for moof in fragments:
+            mp4_fragment_ends(moof, default_durations, decode_times)
+        for track in tracks:
+            if track['id'] in decode_times and track['timescale']:
+                track['duration'] = max(track['duration'], decode_times[track['id']] / track['timescale'])
+    
+    seconds = duration / timescale if timescale else 0.0
+    if tracks:
+        seconds = max(seconds, max(track['duration'] for track in tracks))
+    return {'duration': seconds, 'tracks': tracks}
+
+def verify_output(output_file, expected_seconds, allow_longer=False):
+    """Check the merged video against the total duration of the downloaded segments
+    
+    expected_seconds is None when the segments had no timestamps, then only the MP4
+    structure is checked. allow_longer accepts a longer video, missing segments leave
+    gaps in the timeline. Returns (ok, message).
+    """
+    info = mp4_info(output_file) if os.path.exists(output_file) else None
+    if not info or not info['tracks']:
+        return False, "the output is not a complete MP4 file"
+    
+    tracks = " + ".join(track['type'] for track in info['tracks'])
+    if expected_seconds is None:
+        return True, f"{format_duration(info['duration'])}, {tracks} (segment durations unknown)"
+    
+    # A frame or two can be lost or gained at every join, allow 1% but at least a second
+    tolerance = max(1.0, expected_seconds * 0.01)
+    difference = info['duration'] - expected_seconds
+    if difference < -tolerance or (difference > tolerance and not allow_longer):
+        return False, f"the video is {info['duration']:.1f}s long but the segments add up to {expected_seconds:.1f}s"
+    return True, f"{format_duration(info['duration'])}, {tracks}"
+
+def check_disk_space(scratch_dir, output_path, estimated_bytes, min_free_bytes, merge_strategy="stream"):
+    """Check there is room for the segments and the output before downloading, returns False if not"""
+    scratch_free = shutil.disk_usage(scratch_dir).free
+    output_free = shutil.disk_usage(output_path).free
+    same_drive = os.stat(scratch_dir).st_dev == os.stat(output_path).st_dev
+    
+    # The output is about as large as the segments together
+    needed_on_output = estimated_bytes + (min_free_bytes if same_drive else 0)
+    if output_free < needed_on_output:
+        print(f"❌ Not enough disk space: about {needed_on_output / (1024 * 1024):.0f} MB needed in {output_path}, "
+              f"{output_free / (1024 * 1024):.0f} MB free")
+        return False
+    
+    # The segments, the chunks of a chunked merge (kept until the cleanup) and the output if it shares the drive
+    copies_on_scratch = 1 + (merge_strategy == "chunked") + same_drive
+    needed_on_scratch = estimated_bytes * copies_on_scratch
+    if scratch_free < needed_on_scratch:
+        print(f"⚠️ Only {scratch_free / (1024 * 1024):.0f} MB free for temporary segments, "
+              "downloads will pause while the merge frees space")
+    return True
+
+def read_ffmpeg_log(log_file):
+    """Get the output ffmpeg wrote to log_file, or "" if there is none"""
+    try:
+        with open(log_file, 'rb') as f:
+            return f.read().decode(errors='replace')
+    except OSError:
+        return ""
+
+class StreamingMerger:
+    """Feed downloaded segments to ffmpeg in order while the rest are still downloading
+    
+    TS segments can be joined byte by byte, so each segment is written to ffmpeg's
+    stdin as soon as every segment before it is done. When the next segment is
+    still missing the feeder waits, and the output is ready right after the last
+    segment arrives instead of after a separate concat step.
+    
+    For live streams total_segments is None until set_total() is called, and the
+    output is written as fragmented MP4 so it can be played while it grows.
+    """
+    
+    def __init__(self, output_file, total_segments, log_file, fragmented=False, ffmpeg_path=None):
+        self.output_file = output_file
+        self.ffmpeg_path = ffmpeg_path or FFMPEG_PATH
+        self.total_segments = total_segments
+        self.log_file = log_file
+        self.fragmented = fragmented
+        self.ready = {}  # index -> filepath, or None for segments that failed
+        self.next_index = 0
+        self.condition = threading.Condition()
+        self.aborted = False
+        self.error = None
+        self.process = None
+        self.log = None
+        self.thread = None
+        # Set when scratch space runs low, merged segments are then deleted right away
+        self.drain_segments = False
+    
+    def start(self):
+        """Start ffmpeg and the thread that feeds it"""
+        ffmpeg_cmd = [
+            self.ffmpeg_path,
+            "-y",  # Replaces the empty file reserved by get_next_filename(), never an existing video
+            "-f", "mpegts",
+            "-i", "pipe:0",
+            "-c", "copy",
+            "-bsf:a", "aac_adtstoasc",
+        ]
+        if self.fragmented:
+            ffmpeg_cmd += ["-movflags", "frag_keyframe+empty_moov"]
+        ffmpeg_cmd.append(self.output_file)
+        # ffmpeg output goes to a file so a full stderr pipe can never block it
+        self.log = open(self.log_file, 'wb')
+        self.process = subprocess.Popen(ffmpeg_cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self.log)
+        self.thread = threading.Thread(target=self.feed, daemon=True)
+        self.thread.start()
+    
+    def add_segment(self, index, filepath):
+        """Mark a segment as finished, filepath is None if it failed and should be skipped"""
+        with self.condition:
+            self.ready[index] = filepath
+            self.condition.notify()
+    
+    def set_total(self, total_segments):
+        """Set the number of segments once a live stream has ended"""
+        with self.condition:
+            self.total_segments = total_segments
+            self.condition.notify()
+    
+    def all_fed(self):
+        return self.total_segments is not None and self.next_index >= self.total_segments
+    
+    def feed(self):
+        """Write segments to ffmpeg in order, waiting whenever the next one isn't there yet"""
+        try:
+            while True:
+                with self.condition:
+                    while self.next_index not in self.ready and not self.aborted and not self.all_fed():
+                        self.condition.wait()
+                    if self.aborted or self.all_fed():
+                        return
+                    filepath = self.ready.pop(self.next_index)
+                    self.next_index += 1
+                
+                if filepath:
+                    with open(filepath, 'rb') as f:
+                        shutil.copyfileobj(f, self.process.stdin, 1024 * 1024)
+                    if self.drain_segments:
+                        os.remove(filepath)
+        except (OSError, ValueError) as e:
+            # Broken pipe if ffmpeg exited early, the return code tells the rest
+            self.error = e
+        finally:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+    
+    def needs_segment(self, index):
+        """True if the merge can't continue until this segment is downloaded"""
+        return index <= self.next_index
+    
+    def read_log(self):
+        """Get ffmpeg's output"""
+        return read_ffmpeg_log(self.log_file)
+    
+    def finish(self):
+        """Wait for ffmpeg to write the rest of the output and return its exit code
+        
+        If feeding stopped early (e.g. a segment file vanished) ffmpeg still exits
+        cleanly with a truncated video, so that counts as a failure too.
+        """
+        self.thread.join()
+        returncode = self.process.wait()
+        if self.error is not None:
+            self.log.write(f"\nFeeding segments to ffmpeg failed: {self.error}\n".encode())
+            returncode = returncode or 1
+        self.log.close()
+        return returncode
+    
+    def kill(self):
+        """Kill ffmpeg without waiting, safe to call from any thread"""
+        with self.condition:
+            self.aborted = True
+            self.condition.notify()
+        if self.process.poll() is None:
+            self.process.kill()
+    
+    def abort(self):
+        """Stop feeding, kill ffmpeg and remove the partial output"""
+        self.kill()
+        self.process.wait()
+        self.thread.join()
+        self.log.close()
+        if os.path.exists(self.output_file):
+            os.remove(self.output_file)
+
+class ChunkedMerger:
+    """Merge groups of segments into .ts chunks in parallel, then join the chunks
+    
+    For multi-hour videos a single ffmpeg pass over thousands of segments runs on
+    one core. Here every group of segments is remuxed into an intermediate chunk
+    by its own ffmpeg as soon as the group is complete, several at a time, and the
+    final pass only has to join a handful of chunks.
+    """
+    
+    def __init__(self, output_file, total_segments, log_file, temp_dir, group_size=100, max_workers=None, ffmpeg_path=None):
+        self.output_file = output_file
+        self.ffmpeg_path = ffmpeg_path or FFMPEG_PATH
+        self.log_file = log_file
+        self.temp_dir = temp_dir
+        self.group_size = group_size
+        self.max_workers = max_workers or os.cpu_count() or 2
+        self.group_count = (total_segments + group_size - 1) // group_size
+        self.remaining = [min(group_size, total_segments - g * group_size) for g in range(self.group_count)]
+        self.ready = {}  # index -> filepath, or None for segments that failed
+        self.chunk_futures = [None] * self.group_count
+        self.processes = set()
+        self.lock = threading.Lock()
+        self.aborted = False
+        self.executor = None
+        self.log = None
+        # Set when scratch space runs low, segments are then deleted once their chunk is written
+        self.drain_segments = False
+    
+    def start(self):
+        """Start the pool that merges the groups"""
+        self.log = open(self.log_file, 'wb')
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+    
+    def add_segment(self, index, filepath):
+        """Mark a segment as finished, its group is merged once all of its segments are"""
+        with self.lock:
+            self.ready[index] = filepath
+            group = index // self.group_size
+            self.remaining[group] -= 1
+            if self.remaining[group] == 0 and not self.aborted:
+                self.chunk_futures[group] = self.executor.submit(self.merge_group, group)
+    
+    def run_ffmpeg(self, ffmpeg_cmd):
+        """Run one ffmpeg process, keeping track of it so abort() can kill it"""
+        process = subprocess.Popen(ffmpeg_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        with self.lock:
+            self.processes.add(process)
+            if self.aborted:
+                process.kill()
+        _, stderr = process.communicate()
+        with self.lock:
+            self.processes.discard(process)
+            self.log.write(stderr)
+        return process.returncode
+    
+    def write_concat_list(self, list_file, filepaths):
+        """Write an input list for ffmpeg's concat demuxer"""
+        with open(list_file, 'w') as f:
+            for filepath in filepaths:
+                f.write(f"file '{filepath}'\n")
+    
+    def merge_group(self, group):
+        """Remux one group of segments into a single .ts chunk"""
+        start = group * self.group_size
+        filepaths = [self.ready[i] for i in range(start, start + self.group_size) if self.ready.get(i)]
+        if not filepaths:
+            return None
+        
+        list_file = os.path.join(self.temp_dir, f"chunk_{group:05d}.txt")
+        chunk_file = os.path.join(self.temp_dir, f"chunk_{group:05d}.ts")
+        self.write_concat_list(list_file, filepaths)
+        
+        ffmpeg_cmd = [
+            self.ffmpeg_path,
+            "-y",
+            "-f", "concat",
+            "-safe", "0",
+            "-i", list_file,
+            "-c", "copy",
+            "-f", "mpegts",
+            chunk_file
+        ]
+        if self.run_ffmpeg(ffmpeg_cmd) != 0:
+            raise RuntimeError(f"Merging chunk {group} failed")
+        if self.drain_segments:
+            for filepath in filepaths:
+                os.remove(filepath)
+        return chunk_file
+    
+    def needs_segment(self, index):
+        """True if the segment belongs to the first group that isn't complete yet"""
+        with self.lock:
+            for group, remaining in enumerate(self.remaining):
+                if remaining > 0:
+                    return index // self.group_size == group
+        return True
+    
+    def read_log(self):
+        """Get ffmpeg's output"""
+        return read_ffmpeg_log(self.log_file)
+    
+    def finish(self):
+        """Wait for the chunks and join them into the output, returns ffmpeg's exit code"""
+        try:
+            chunk_files = [future.result() for future in self.chunk_futures if future]
+        except (RuntimeError, CancelledError):
+            self.log.close()
+            return 1
+        finally:
+            self.executor.shutdown(wait=True)
+        
+        list_file = os.path.join(self.temp_dir, "chunks.txt")
+        self.write_concat_list(list_file, [f for f in chunk_files if f])
+        
+        ffmpeg_cmd = [
+            self.ffmpeg_path,
+            "-y",
+            "-f", "concat",
+            "-safe", "0",
+            "-i", list_file,
+            "-c", "copy",
+            "-bsf:a", "aac_adtstoasc",
+            self.output_file
+        ]
+        returncode = self.run_ffmpeg(ffmpeg_cmd)
+        self.log.close()
+        return returncode
+    
+    def kill(self):
+        """Cancel queued groups and kill running ffmpeg processes without waiting"""
+        with self.lock:
+            self.aborted = True
+            for future in self.chunk_futures:
+                if future:
+                    future.cancel()
+            for process in self.processes:
+                process.kill()
+    
+    def abort(self):
+        """Cancel queued groups, kill running ffmpeg processes and remove the partial output"""
+        self.kill()
+        self.executor.shutdown(wait=True)
+        self.log.close()
+        if os.path.exists(self.output_file):
+            os.remove(self.output_file)
+
+def create_merger(merge_strategy, output_file, total_segments, temp_dir, group_size=None, ffmpeg_path=None):
+    """Create the merger for a merge strategy ("stream" or "chunked")"""
+    log_file = os.path.join(temp_dir, "ffmpeg_log.txt")
+    if total_segments is None:
+        # Live stream, only the streaming merger can take segments without knowing how many there will be
+        return StreamingMerger(output_file, None, log_file, fragmented=True, ffmpeg_path=ffmpeg_path)
+    if merge_strategy == "chunked":
+        return ChunkedMerger(output_file, total_segments, log_file, temp_dir, group_size=group_size or MERGE_GROUP_SIZE, ffmpeg_path=ffmpeg_path)
+    if merge_strategy == "stream":
+        return StreamingMerger(output_file, total_segments, log_file, ffmpeg_path=ffmpeg_path)
+    raise ValueError(f"Unknown merge strategy: {merge_strategy}")
+
+def follow_live_stream(base_url, next_index, temp_dir, session, cancel_token, merger, follow_timeout=None, follow_duration=None, config=None):
+    """Keep downloading new segments of a live stream as they are published
+    
+    The next segment index is polled at half the segment duration, and each new
+    segment goes straight to the merger. Stops when no new segment appeared for
+    follow_timeout seconds (the stream ended), after follow_duration seconds, or
+    on cancellation. Returns (number of segments, downloaded files, bytes, seconds per segment index).
+    """
+    downloaded_files = []
+    total_bytes = 0
+    segment_durations = {}
+    segment_seconds = None
+    started = time.perf_counter()
+    last_new_segment = started
+    
+    print("🔴 Following live stream, new segments are downloaded as they appear...")
+    while not cancel_token.is_cancelled():
+        if follow_duration and time.perf_counter() - started > follow_duration:
+            print("\n⏹️  Reached the maximum capture time")
+            break
+        
+        url = base_url.replace("0.ts", f"{next_index}.ts")
+        filepath = download_segment_with_retry((next_index, url, temp_dir, session, cancel_token, None, None, None, config))
+        if filepath:
+            segment_durations[next_index] = ts_duration(filepath)
+            if segment_seconds is None:
+                segment_seconds = segment_durations[next_index]
+            size = os.path.getsize(filepath)
+            merger.add_segment(next_index, filepath)
+            downloaded_files.append(filepath)
+            total_bytes += size
+            next_index += 1
+            last_new_segment = time.perf_counter()
+            print(f"\r🔴 Live: {next_index} segments, {total_bytes / (1024 * 1024):.1f}MB captured", end='', flush=True)
+            # Check right away, there may already be more segments waiting
+            continue
+        
+        # Not published yet: wait about half a segment before asking again
+        interval = max((segment_seconds or 2.0) / 2, 0.5)
+        timeout = follow_timeout or max(30.0, 4 * (segment_seconds or 2.0))
+        if time.perf_counter() - last_new_segment > timeout:
+            print(f"\n⏹️  No new segments for {timeout:.0f}s, the stream has ended")
+            break
+        cancel_token.wait(interval)
+    
+    return next_index, downloaded_files, total_bytes, segment_durations
+
+def remerge_segments(output_file, temp_dir, num_segments, cancel_token, config):
+    """Merge the segments kept in temp_dir again with a single ffmpeg, returns its exit code"""
+    if os.path.exists(output_file):
+        os.remove(output_file)
+    merger = create_merger("stream", output_file, num_segments, temp_dir, ffmpeg_path=config.ffmpeg_path)
+    merger.start()
+    cancel_token.on_cancel(merger.kill)
+    for index in range(num_segments):
+        filepath = os.path.join(temp_dir, f"segment_{index:05d}.ts")
+        merger.add_segment(index, filepath if os.path.exists(filepath) else None)
+    return merger.finish()
+
+def download_video_from_pattern(base_url, max_segments=None, output_filename=None, config=None, cancel_token=None, session=None, follow=False, follow_timeout=None, follow_duration=None):
+    """Download video using the TS segment pattern with automatic detection
+    
+    config is a Config with the settings for the job (see load_config()), including:
+    
+    reuse_existing controls what happens when the same video was already downloaded:
+    "link" hardlinks the existing file to the new name, "copy" copies it and None
+    disables the check and always downloads.
+    
+    merge_strategy is "stream" to feed segments to a single ffmpeg while downloading,
+    or "chunked" to merge groups of segments in parallel (faster for very long videos).
+    
+    scratch_dir is where segments are kept while downloading (defaults to the output
+    folder). The merged video is always written straight to the output folder.
+    
+    hedge_requests sends a second request for segments that are far slower than the rest.
+    
+    max_segments defaults to config.max_segments.
+    
+    cancel_token is a CancellationToken that stops the job when cancelled.
+    
+    session can be passed in to reuse its open connections across several downloads.
+    
+    follow keeps downloading a live stream after the segments found so far, until no
+    new segment appears for follow_timeout seconds or follow_duration seconds have passed.
+    """
+    if config is None:
+        config = Config()
+    if max_segments is None:
+        max_segments = config.max_segments
+    if cancel_token is None:
+        cancel_token = CancellationToken()
     
     if output_filename is None:
         output_filename = "yandex_video.mp4"
     elif not output_filename.endswith('.mp4'):
         output_filename += '.mp4'
         
-    output_path = get_default_downloads_folder()
-    temp_dir = os.path.join(output_path, f"temp_{os.path.splitext(output_filename)[0]}")
+    output_path = config.output_dir or get_default_downloads_folder()
+    output_file = os.path.join(output_path, output_filename)
+    
+    # Never download into an existing video, the merge would overwrite it
+    if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
+        stem = os.path.splitext(output_filename)[0].replace('{', '{{').replace('}', '}}')
+        try:
+            output_filename = get_next_filename(output_path, stem + ".mp4")
+        except OSError as e:
+            print(f"❌ {os.path.basename(output_file)} already exists and no other name could be reserved: {str(e)}")
+            return False
+        print(f"⚠️ {os.path.basename(output_file)} already exists, saving as {output_filename}")
+        output_file = os.path.join(output_path, output_filename)
+    
+    try:
+        with cancel_token.child() as job_token:
+            return download_video_to_file(
+                base_url, max_segments, output_file, config, job_token, session=session,
+                follow=follow, follow_timeout=follow_timeout, follow_duration=follow_duration
+            )
+    finally:
+        # A job that didn't finish leaves the empty file reserved by get_next_filename() behind
+        try:
+            if os.path.getsize(output_file) == 0:
+                os.remove(output_file)
+        except OSError:
+            pass
+
+def download_video_to_file(base_url, max_segments, output_file, config, cancel_token, session=None, follow=False, follow_timeout=None, follow_duration=None):
+    """Run the download job for download_video_from_pattern(), writing the video to output_file"""
+    output_path, output_filename = os.path.split(output_file)
+    video_id = get_video_id(base_url)
+    
+    # Skip the whole job if this video was already downloaded and the file is unchanged
+    # (not for live streams, they have new content every time)
+    if config.reuse_existing and not follow:
+        existing = find_existing_download(output_path, video_id)
+        if existing:
+            print(f"♻️  This video was already downloaded to: {existing['path']}")
+            reused = reuse_existing_download(existing['path'], output_file, config.reuse_existing)
+            if reused:
+                print(f"✅ Video successfully saved to: {reused}")
+                return True
+            # Only happens if another job wrote output_file in the meantime
+            print(f"❌ {output_filename} already exists")
+            return False
+    
+    # Named after the video, so a cancelled or failed job resumes from the segments it already has
+    scratch_dir = config.scratch_dir or output_path
+    temp_dir = os.path.join(scratch_dir, f"temp_{hashlib.sha1(video_id.encode()).hexdigest()[:12]}")
     
     os.makedirs(temp_dir, exist_ok=True)
     os.makedirs(output_path, exist_ok=True)
     
     # Create session
-    session = requests.Session()
+    if session is None:
+        import requests
+        session = requests.Session()
+    track_connections(session)
     
     # Detect actual number of segments (limit search based on user's max)
-    actual_segments = detect_segment_count(base_url, session, max_segments)
+    segment_sizes = {}  # index -> Content-Length seen by the detection
+    actual_segments = detect_segment_count(base_url, session, max_segments, cancel_token=cancel_token, config=config, sizes=segment_sizes)
+    
+    if cancel_token.is_cancelled():
+        print("🛑 Download cancelled by user!")
+        return False
     
     if actual_segments == 0:
         print("❌ No segments found! The URL may be invalid or expired.")
@@ -303,127 +2015,399 @@ def download_video_from_pattern(base_url, max_segments, output_filename=None):
         segment_url = base_url.replace("0.ts", f"{i}.ts")
         segment_urls.append(segment_url)
     
+    # Check there is room for the whole video before spending time downloading it
+    # The detection already saw every segment's size, no extra request needed
+    known_sizes = [size for index, size in segment_sizes.items() if size and index < num_segments]
+    min_free_bytes = config.min_scratch_free_mb * 1024 * 1024
+    estimated_bytes = None
+    if known_sizes:
+        estimated_bytes = sum(known_sizes) * num_segments // len(known_sizes)
+        print(f"💽 Estimated size: {estimated_bytes / (1024 * 1024):.1f} MB")
+        if not check_disk_space(temp_dir, output_path, estimated_bytes, min_free_bytes, config.merge_strategy):
+            return False
+    
+    # Check ffmpeg before downloading, the merge starts with the first segment
+    try:
+        subprocess.run([config.ffmpeg_path, "-version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        print(f"❌ Error: ffmpeg not found at {config.ffmpeg_path}")
+        return False
+    
+    merger = create_merger(
+        config.merge_strategy, output_file, None if follow else len(segment_urls), temp_dir,
+        group_size=config.merge_group_size, ffmpeg_path=config.ffmpeg_path
+    )
+    merger.start()
+    # ffmpeg is killed as soon as the job is cancelled, even while the merge is being finished
+    cancel_token.on_cancel(merger.kill)
+    space_guard = ScratchSpaceGuard(temp_dir, min_free_bytes, merger)
+    
+    hedger = None
+    if config.hedge_requests:
+        hedger = HedgeMonitor(session, cancel_token, timeout=config.segment_timeout, chunk_size=config.chunk_size)
+    if hedger:
+        hedger.start()
+    
     # Download segments with modern progress tracking
     downloaded_files = []
     failed_segments = []
-    completed = 0
+    segment_durations = {}  # index -> seconds, to verify the merged video
     total_bytes = 0
     total_segments = len(segment_urls)
+    progress = ProgressTracker(
+        total_segments, estimated_bytes,
+        prefix=f"Downloading {num_segments} segments",
+        interval=config.progress_interval,
+        show_workers=config.show_worker_progress
+    )
+    progress.start()
     
+    executor = ThreadPoolExecutor(max_workers=config.max_workers, thread_name_prefix="worker")
     try:
-        with ThreadPoolExecutor(max_workers=2) as executor:
-            # Submit all tasks
-            future_to_index = {
-                executor.submit(download_segment_with_retry, (i, url, temp_dir, session)): i 
-                for i, url in enumerate(segment_urls)
-            }
+        # Submit all tasks
+        future_to_index = {
+            executor.submit(download_segment_with_retry, (i, url, temp_dir, session, cancel_token, space_guard, hedger, progress, config)): i 
+            for i, url in enumerate(segment_urls)
+        }
+        
+        # Queued segments are dropped on cancel instead of each one starting and returning
+        def cancel_queued_segments():
+            for future in future_to_index:
+                future.cancel()
+        cancel_token.on_cancel(cancel_queued_segments)
+        
+        # Process completed tasks
+        for future in as_completed(future_to_index):
+            # Check cancellation
+            if cancel_token.is_cancelled():
+                break
             
-            # Process completed tasks
-            for future in as_completed(future_to_index):
-                # Check cancellation
-                with cancellation_lock:
-                    if cancelled:
-                        print("\n🛑 Download cancelled by user!")
-                        return False
-                
-                index = future_to_index[future]
-                completed += 1
-                
-                try:
-                    filepath = future.result()
-                    if filepath:
-                        downloaded_files.append(filepath)
-                        # Track downloaded bytes
-                        if os.path.exists(filepath):
-                            total_bytes += os.path.getsize(filepath)
-                    else:
-                        failed_segments.append(index)
-                except Exception as e:
+            index = future_to_index[future]
+            
+            try:
+                filepath = future.result()
+                size = 0
+                if filepath:
+                    downloaded_files.append(filepath)
+                    # Track downloaded bytes (before the merger gets the file, it may delete it)
+                    size = os.path.getsize(filepath)
+                    total_bytes += size
+                    if config.verify_output:
+                        segment_durations[index] = ts_duration(filepath)
+                else:
                     failed_segments.append(index)
-                
-                # Update progress bar
-                success_rate = len(downloaded_files) / completed * 100 if completed > 0 else 0
-                mb_downloaded = total_bytes / (1024 * 1024)
-                
-                print_progress_bar(
-                    completed, total_segments,
-                    prefix=f"Downloading {num_segments} segments",
-                    suffix=f"({completed}/{total_segments}, {mb_downloaded:.1f}MB, {success_rate:.1f}% success)"
-                )
-                
+            except Exception as e:
+                filepath = None
+                size = 0
+                failed_segments.append(index)
+            
+            # Hand the segment to ffmpeg, it is merged as soon as all earlier ones are
+            merger.add_segment(index, filepath)
+            
+            # The progress bar itself is redrawn by the tracker at a fixed interval
+            progress.segment_done(filepath is not None, size)
+            
     except KeyboardInterrupt:
-        print("\n🛑 Download cancelled by user!")
+        cancel_token.cancel()
+    finally:
+        # A cancelled job doesn't wait for its workers, their requests were cut off
+        if cancel_token.is_cancelled():
+            shutdown_now(executor)
+        else:
+            executor.shutdown(wait=True)
+        if hedger:
+            hedger.stop()
+        progress.stop()
+    
+    # A live stream keeps publishing segments after the ones found so far
+    if follow and not cancel_token.is_cancelled():
+        num_segments, live_files, live_bytes, live_durations = follow_live_stream(
+            base_url, num_segments, temp_dir, session, cancel_token, merger,
+            follow_timeout=follow_timeout, follow_duration=follow_duration, config=config
+        )
+        downloaded_files += live_files
+        total_bytes += live_bytes
+        segment_durations.update(live_durations)
+        merger.set_total(num_segments)
+    
+    if cancel_token.is_cancelled():
+        merger.abort()
+        print(f"\n🛑 Download cancelled by user! (stopped in {cancel_token.seconds_since_cancel():.2f}s)")
+        print("💡 Downloaded segments were kept, download the same video again to resume")
         return False
     
     # Calculate total size
-    total_size_mb = sum(os.path.getsize(f) for f in downloaded_files) / (1024 * 1024) if downloaded_files else 0
+    total_size_mb = total_bytes / (1024 * 1024)
     
     print(f"\n✅ Download completed!")
     print(f"📊 Results: {len(downloaded_files)}/{num_segments} segments downloaded successfully ({total_size_mb:.2f} MB)")
     
+    if hedger and hedger.launched:
+        print(f"🏁 Hedged requests for slow segments: {hedger.summary()}")
+    
     if failed_segments:
         print(f"⚠️ {len(failed_segments)} segments failed to download")
     
     if len(downloaded_files) == 0:
         print("❌ No segments were downloaded successfully!")
         print("💡 Tip: Try getting a fresh URL from your browser's Network tab")
+        merger.abort()
         return False
     
     # Check if cancelled before combining
-    with cancellation_lock:
-        if cancelled:
-            print("🛑 Download cancelled before combining segments!")
-            return False
-    
-    # Create segments file for ffmpeg
-    segments_file = os.path.join(temp_dir, "segments.txt")
-    with open(segments_file, 'w') as f:
-        for filepath in sorted(downloaded_files):
-            f.write(f"file '{filepath}'\n")
-    
-    # Combine with ffmpeg
-    output_file = os.path.join(output_path, output_filename)
-    print(f"🔧 Combining {len(downloaded_files)} segments into {output_filename}...")
-    
-    # Check ffmpeg
-    try:
-        subprocess.run([FFMPEG_PATH, "-version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    except FileNotFoundError:
-        print(f"❌ Error: ffmpeg not found at {FFMPEG_PATH}")
+    if cancel_token.is_cancelled():
+        print("🛑 Download cancelled before combining segments!")
+        merger.abort()
         return False
     
-    # Use ffmpeg to combine
-    ffmpeg_cmd = [
-        FFMPEG_PATH,
-        "-f", "concat",
-        "-safe", "0",
-        "-i", segments_file,
-        "-c", "copy",
-        "-bsf:a", "aac_adtstoasc",
-        output_file
-    ]
+    # Most of the merge already happened during the download, wait for the rest
+    print(f"🔧 Combining {len(downloaded_files)} segments into {output_filename}...")
     
     try:
-        process = subprocess.run(ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        returncode = merger.finish()
     except KeyboardInterrupt:
+        cancel_token.cancel()
+    
+    if cancel_token.is_cancelled():
         print("\n🛑 FFmpeg process cancelled!")
+        merger.abort()
         return False
     
-    if process.returncode == 0:
+    # Check the video before the segments are deleted, re-merging is much cheaper than downloading again
+    if returncode == 0 and config.verify_output:
+        expected_seconds = None
+        if segment_durations and None not in segment_durations.values():
+            expected_seconds = sum(segment_durations.values())
+        verified, message = verify_output(output_file, expected_seconds, allow_longer=bool(failed_segments))
+        # Segments are deleted during the merge when scratch space ran low
+        segments_kept = all(os.path.exists(f) for f in downloaded_files)
+        
+        if not verified and segments_kept:
+            print(f"⚠️ Verification failed: {message}")
+            print("🔁 Merging the downloaded segments again...")
+            returncode = remerge_segments(output_file, temp_dir, num_segments, cancel_token, config)
+            if cancel_token.is_cancelled():
+                print("\n🛑 FFmpeg process cancelled!")
+                return False
+            if returncode == 0:
+                verified, message = verify_output(output_file, expected_seconds, allow_longer=bool(failed_segments))
+        
+        if returncode == 0 and not verified:
+            print(f"❌ The merged video doesn't match the downloaded segments: {message}")
+            set_aside_failed_output(output_file)
+            if segments_kept:
+                print(f"💡 Segments were kept in {temp_dir}, download the same video again to retry")
+            else:
+                print("💡 Some segments were already deleted to free scratch space, they are downloaded again if you retry")
+            return False
+        if returncode == 0:
+            print(f"🔎 Verified: {message}")
+    
+    if returncode == 0:
         print(f"✅ Video successfully saved to: {output_file}")
         if failed_segments:
             print(f"⚠️  Note: {len(failed_segments)} segments were missing, but video was created successfully")
+        elif not follow:
+            # Only complete videos go into the index, incomplete ones should be retried. A live
+            # capture is never known to be complete, it may have stopped at follow_duration
+            try:
+                record_download(output_path, video_id, num_segments, total_bytes, output_file)
+            except OSError as e:
+                print(f"⚠️ Could not update download index: {str(e)}")
         
         # Cleanup
-        import shutil
         shutil.rmtree(temp_dir)
         return True
     else:
         print("❌ Error combining segments:")
-        print(process.stderr.decode())
+        print(merger.read_log())
+        set_aside_failed_output(output_file)
         return False
 
+def set_aside_failed_output(output_file):
+    """Rename a merge that failed to <name>.failed.mp4, so it doesn't look like a finished download"""
+    try:
+        # An empty file is the reservation from get_next_filename(), the caller removes it
+        if os.path.getsize(output_file) == 0:
+            return
+        failed_file = os.path.splitext(output_file)[0] + ".failed.mp4"
+        os.replace(output_file, failed_file)
+        print(f"💡 The bad merge was renamed to {os.path.basename(failed_file)}")
+    except OSError:
+        pass
+
+class DownloadQueue:
+    """Runs queued downloads one after another in a single long-running process
+    
+    All jobs share one session, so connections to the CDN stay open between
+    videos. A video that is already queued or downloading is not added again.
+    """
+    
+    def __init__(self, config, cancel_token):
+        self.config = config
+        self.cancel_token = cancel_token
+        self.jobs = queue.Queue()
+        self.in_flight = set()  # video ids that are queued or downloading
+        self.lock = threading.Lock()
+        self.session = None
+    
+    def add(self, url, source=""):
+        """Queue a segment URL, returns False if it is invalid or already in flight"""
+        base_url = extract_base_url(url.strip())
+        if not base_url:
+            print(f"⚠️ Skipping {source or 'URL'}: no '0.ts' segment pattern found")
+            return False
+        
+        video_id = get_video_id(base_url)
+        with self.lock:
+            if video_id in self.in_flight:
+                print(f"♻️  Already queued, skipping {source or base_url[:80]}")
+                return False
+            self.in_flight.add(video_id)
+        self.jobs.put((base_url, video_id))
+        print(f"📥 Queued {source or base_url[:80]} ({self.jobs.qsize()} waiting)")
+        return True
+    
+    def run(self):
+        """Download queued videos until the cancel token is cancelled"""
+        import requests
+        self.session = track_connections(requests.Session())
+        output_path = self.config.output_dir or get_default_downloads_folder()
+        
+        while not self.cancel_token.is_cancelled():
+            try:
+                base_url, video_id = self.jobs.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            
+            try:
+                output_filename = get_next_filename(output_path, self.config.filename_template, video_id=video_id)
+                print(f"\n🚀 Starting download of {output_filename}...")
+                print(f"🔗 Base URL: {base_url[:80]}...")
+                success = download_video_from_pattern(
+                    base_url, output_filename=output_filename, config=self.config,
+                    cancel_token=self.cancel_token, session=self.session
+                )
+                print("🎉 Download completed successfully!" if success else "❌ Download failed.")
+            except Exception as e:
+                print(f"❌ Error: {str(e)}")
+            finally:
+                with self.lock:
+                    self.in_flight.discard(video_id)
+
+def read_drop_file(filepath):
+    """Get the segment URLs from a dropped .txt (one URL per line) or .m3u8 playlist"""
+    with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
+        lines = [line.strip() for line in f]
+    urls = [line for line in lines if line.startswith(('http://', 'https://')) and '.ts' in line]
+    if filepath.lower().endswith('.m3u8'):
+        # A playlist lists every segment of one video, only the first one is needed
+        return urls[:1]
+    return urls
+
+def watch_folder(folder, download_queue, cancel_token, interval=1.0):
+    """Queue the URLs in .txt and .m3u8 files dropped into folder, then move them to folder/processed"""
+    processed_dir = os.path.join(folder, "processed")
+    os.makedirs(processed_dir, exist_ok=True)
+    print(f"👀 Watching {folder} for .txt and .m3u8 files")
+    
+    while not cancel_token.wait(interval):
+        try:
+            names = sorted(os.listdir(folder))
+        except OSError as e:
+            print(f"⚠️ Could not read {folder}: {str(e)}")
+            continue
+        
+        for name in names:
+            filepath = os.path.join(folder, name)
+            if not name.lower().endswith(('.txt', '.m3u8')) or not os.path.isfile(filepath):
+                continue
+            # Give whoever is writing the file a moment to finish
+            if time.time() - os.path.getmtime(filepath) < interval:
+                continue
+            try:
+                urls = read_drop_file(filepath)
+                if not urls:
+                    print(f"⚠️ No segment URLs in {name}, it needs full http(s) URLs of .ts segments")
+                    if name.lower().endswith('.m3u8'):
+                        print("💡 Playlists with relative segment paths don't say which server they came from, drop a .txt with one segment URL instead")
+                for url in urls:
+                    download_queue.add(url, source=name)
+                os.replace(filepath, os.path.join(processed_dir, name))
+            except OSError as e:
+                print(f"⚠️ Could not process {name}: {str(e)}")
+
+def pipes_supported():
+    """Named pipes need os.mkfifo(), which Windows doesn't have"""
+    return hasattr(os, 'mkfifo')
+
+def is_named_pipe(path):
+    """True if path is a named pipe, a regular file would be read over and over without blocking"""
+    try:
+        return stat.S_ISFIFO(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+def read_named_pipe(pipe_path, download_queue, cancel_token):
+    """Queue every URL written to a named pipe, one per line (e.g. echo URL > pipe)"""
+    if not os.path.exists(pipe_path):
+        os.mkfifo(pipe_path)
+    if not is_named_pipe(pipe_path):
+        print(f"❌ {pipe_path} exists and is not a named pipe, not reading it")
+        return
+    print(f"👂 Reading URLs from {pipe_path}")
+    
+    while not cancel_token.is_cancelled():
+        # Opening blocks until a writer connects, reading ends when it disconnects
+        with open(pipe_path, 'r') as pipe:
+            for line in pipe:
+                if line.strip():
+                    download_queue.add(line, source=line.strip()[:80])
+
+def run_ingest(watch=None, pipe=None, config=None):
+    """Keep running and download every URL dropped into a folder or written to a pipe"""
+    global cli_cancel_token
+    cli_cancel_token = CancellationToken()
+    download_queue = DownloadQueue(config or Config(), cli_cancel_token)
+    
+    if watch:
+        threading.Thread(target=watch_folder, args=(watch, download_queue, cli_cancel_token), daemon=True).start()
+    if pipe:
+        threading.Thread(target=read_named_pipe, args=(pipe, download_queue, cli_cancel_token), daemon=True).start()
+    print("💡 Press Ctrl+C to stop")
+    
+    download_queue.run()
+    print("\n🛑 Stopped watching for new downloads.")
+
 if __name__ == "__main__":
+    # Register signal handler for Ctrl+C (only when run as a script, importing has no side effects)
+    signal.signal(signal.SIGINT, signal_handler)
+    
+    parser = argparse.ArgumentParser(description="Download Yandex videos from .ts segment URLs")
+    parser.add_argument("--watch", metavar="FOLDER", help="Keep running and download URLs from .txt/.m3u8 files dropped into FOLDER")
+    parser.add_argument("--pipe", metavar="PATH", help="Keep running and download URLs written to the named pipe PATH")
+    parser.add_argument("--follow", action="store_true", help="Live stream: keep downloading new segments until the stream ends")
+    parser.add_argument("--follow-duration", type=float, metavar="SECONDS", help="Stop following a live stream after this many seconds")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    
+    try:
+        config = config_from_args(args)
+    except (OSError, ValueError) as e:
+        print(f"❌ Invalid configuration: {str(e)}")
+        sys.exit(1)
+    
+    if args.pipe and not pipes_supported():
+        print("❌ --pipe needs named pipes, which are not available on Windows. Use --watch FOLDER instead.")
+        sys.exit(1)
+    if args.pipe and os.path.exists(args.pipe) and not is_named_pipe(args.pipe):
+        print(f"❌ {args.pipe} exists and is not a named pipe. Pass a new path, it is created as a pipe.")
+        sys.exit(1)
+    
+    if args.watch or args.pipe:
+        run_ingest(watch=args.watch, pipe=args.pipe, config=config)
+        sys.exit(0)
+    
     print("🎬 Yandex Video Downloader")
     print("=" * 40)
     print("Instructions:")
@@ -444,40 +2428,44 @@ if __name__ == "__main__":
             sys.exit(1)
         
         # Extract the pattern
-        if "0.ts" in sample_url:
-            base_url = sample_url
-        else:
-            # Try to find the pattern
-            match = re.search(r'(https?://[^?]+)0\.ts([^?]*\?.*)', sample_url)
-            if match:
-                base_url = match.group(1) + "0.ts" + match.group(2)
-            else:
-                print("❌ Could not extract URL pattern. Please provide a URL containing '0.ts'")
-                sys.exit(1)
+        base_url = extract_base_url(sample_url)
+        if not base_url:
+            print("❌ Could not extract URL pattern. Please provide a URL containing '0.ts'")
+            sys.exit(1)
         
         # Set a reasonable default maximum (we'll detect the actual number)
-        max_segments = 200  # High enough to handle most videos  # Default
+        max_segments = config.max_segments
         
         # Auto-generate filename
-        output_path = get_default_downloads_folder()
-        output_filename = get_next_filename(output_path)
+        output_path = config.output_dir or get_default_downloads_folder()
+        try:
+            output_filename = get_next_filename(output_path, config.filename_template, video_id=get_video_id(base_url))
+        except OSError as e:
+            print(f"❌ Could not create a file in {output_path}: {str(e)}")
+            sys.exit(1)
         
         print(f"\n🚀 Starting download...")
         print(f"🔗 Base URL: {base_url[:80]}...")
         print(f"📊 Maximum segments: {max_segments}")
+        if config.profile != "default":
+            print(f"⚙️  Profile: {config.profile}")
         print(f"💾 Output: {output_filename}")
         print()
         
-        success = download_video_from_pattern(base_url, max_segments, output_filename)
+        # From here on Ctrl+C cancels the download instead of exiting
+        cli_cancel_token = CancellationToken()
+        success = download_video_from_pattern(
+            base_url, max_segments, output_filename, config=config, cancel_token=cli_cancel_token,
+            follow=args.follow, follow_duration=args.follow_duration
+        )
         
         if success:
             print("\n🎉 Download completed successfully!")
         else:
-            with cancellation_lock:
-                if cancelled:
-                    print("\n❌ Download was cancelled.")
-                else:
-                    print("\n❌ Download failed. Check the error messages above.")
+            if cli_cancel_token.is_cancelled():
+                print("\n❌ Download was cancelled.")
+            else:
+                print("\n❌ Download failed. Check the error messages above.")
                 
     except KeyboardInterrupt:
         print("\n\n🛑 Operation cancelled by user!")
@@ -9,6 +9,7 @@ from contextlib import redirect_stdout
 import SimpleYandexDownloader as downloader
 import itertools
 import time
+from dataclasses import replace
 
 class RedirectText:
     def __init__(self, text_widget):
@@ -79,6 +80,13 @@ class YandexDownloaderGUI:
         self.version = "1.0.0"
         self.copyright = "© 2025 Dykke"
         
+        # Settings from the config file, YANDEX_DL_* variables and profile
+        try:
+            self.config = downloader.load_config()
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Invalid configuration, using defaults: {str(e)}")
+            self.config = downloader.Config()
+        
         # Set theme
         style = ttk.Style()
         try:
@@ -99,7 +107,7 @@ class YandexDownloaderGUI:
         
         # Output file selection
         ttk.Label(input_frame, text="Output folder:").grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
-        self.output_var = tk.StringVar(value=downloader.get_default_downloads_folder())
+        self.output_var = tk.StringVar(value=self.config.output_dir or downloader.get_default_downloads_folder())
         self.output_entry = ttk.Entry(input_frame, textvariable=self.output_var, width=70)
         self.output_entry.grid(row=1, column=1, padx=5, pady=5, sticky=tk.W+tk.E)
         self.browse_btn = ttk.Button(input_frame, text="Browse", command=self.browse_folder)
@@ -107,7 +115,7 @@ class YandexDownloaderGUI:
         
         # FFMPEG path
         ttk.Label(input_frame, text="FFmpeg path:").grid(row=2, column=0, padx=5, pady=5, sticky=tk.W)
-        self.ffmpeg_var = tk.StringVar(value=downloader.FFMPEG_PATH)
+        self.ffmpeg_var = tk.StringVar(value=self.config.ffmpeg_path)
         self.ffmpeg_entry = ttk.Entry(input_frame, textvariable=self.ffmpeg_var, width=70)
         self.ffmpeg_entry.grid(row=2, column=1, padx=5, pady=5, sticky=tk.W+tk.E)
         self.browse_ffmpeg_btn = ttk.Button(input_frame, text="Browse", command=self.browse_ffmpeg)
@@ -152,6 +160,7 @@ class YandexDownloaderGUI:
         
         # Initialize variables
         self.download_thread = None
+        self.cancel_token = None
         self.redirect = RedirectText(self.log_text)
         
         # Instructions
@@ -200,8 +209,8 @@ class YandexDownloaderGUI:
             self.add_to_log("❌ No URL provided! Please paste a .ts segment URL.\n")
             return
             
-        # Update FFmpeg path in downloader module
-        downloader.FFMPEG_PATH = self.ffmpeg_var.get()
+        # The fields on screen override the loaded settings
+        config = replace(self.config, ffmpeg_path=self.ffmpeg_var.get(), output_dir=self.output_var.get())
         
         # Disable controls
         self.download_btn.configure(state=tk.DISABLED)
@@ -220,37 +229,39 @@ class YandexDownloaderGUI:
         self.log_text.configure(state="disabled")
         
         # Extract the pattern
-        if "0.ts" in url:
-            base_url = url
-        else:
-            # Try to find the pattern
-            match = re.search(r'(https?://[^?]+)0\.ts([^?]*\?.*)', url)
-            if match:
-                base_url = match.group(1) + "0.ts" + match.group(2)
-            else:
-                self.add_to_log("❌ Could not extract URL pattern. Please provide a URL containing '0.ts'\n")
-                self.reset_ui()
-                return
-                
+        base_url = downloader.extract_base_url(url)
+        if not base_url:
+            self.add_to_log("❌ Could not extract URL pattern. Please provide a URL containing '0.ts'\n")
+            self.reset_ui()
+            return
+        
         # Set a reasonable default maximum (we'll detect the actual number)
-        max_segments = 200  # High enough to handle most videos
+        max_segments = config.max_segments
         
         # Auto-generate filename
-        output_path = self.output_var.get()
-        output_filename = downloader.get_next_filename(output_path)
+        output_path = config.output_dir
+        try:
+            output_filename = downloader.get_next_filename(output_path, config.filename_template, video_id=downloader.get_video_id(base_url))
+        except OSError as e:
+            self.add_to_log(f"❌ Could not create a file in {output_path}: {str(e)}\n")
+            self.reset_ui()
+            return
         
         # Redirect stdout to our log
         sys.stdout = self.redirect
         
+        # New token for every download, the Cancel button cancels it
+        self.cancel_token = downloader.CancellationToken()
+        
         # Create a thread for downloading
         self.download_thread = threading.Thread(
             target=self.download_thread_func,
-            args=(base_url, max_segments, output_filename)
+            args=(base_url, max_segments, output_filename, config)
         )
         self.download_thread.daemon = True
         self.download_thread.start()
         
-    def download_thread_func(self, base_url, max_segments, output_filename):
+    def download_thread_func(self, base_url, max_segments, output_filename, config):
         try:
             # Override the progress bar function
             original_print_progress = downloader.print_progress_bar
@@ -289,10 +300,13 @@ class YandexDownloaderGUI:
                 return char
             
             # Override the spinner generation in the downloader module
-            def patched_detect_segment_count(base_url, session, max_limit=None):
+            def patched_detect_segment_count(base_url, session, max_limit=None, cancel_token=None, config=None, sizes=None):
                 """Detect segments with custom spinner for GUI"""
                 print("🔍 Detecting available segments...")
                 
+                if config is None:
+                    config = downloader.Config()
+                
                 headers = {
                     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
                     'Accept': '*/*',
@@ -315,10 +329,12 @@ class YandexDownloaderGUI:
                     # Use a clean line for segment checking
                     print("\n🔍 Checking segment availability...\n")
                     print(f"{custom_spinner()} Verifying first segment...", end="", flush=True)
-                    response = session.get(segment_url, headers=headers, timeout=10, stream=True)
+                    response = session.get(segment_url, headers=headers, timeout=max(10, config.detect_timeout), stream=True)
                     if response.status_code != 200:
                         print("\n❌ First segment not found! URL may be invalid.")
                         return 0
+                    if sizes is not None:
+                        sizes[0] = downloader.content_length(response)
                     
                     # Read a small part to verify it's a valid segment
                     for chunk in response.iter_content(chunk_size=8192):
@@ -330,7 +346,7 @@ class YandexDownloaderGUI:
                     return 0
                 
                 # Use a higher limit to detect more segments
-                max_to_check = 200 if max_limit is None else max_limit
+                max_to_check = config.max_segments if max_limit is None else max_limit
                 
                 # Initialize progress tracking
                 print("\nScanning for available segments:")
@@ -338,13 +354,15 @@ class YandexDownloaderGUI:
                 
                 # Check segments sequentially
                 for i in range(max_to_check):
+                    if cancel_token and cancel_token.is_cancelled():
+                        break
                     segment_url = base_url.replace("0.ts", f"{i}.ts")
                     try:
                         # Only update every 5 segments to reduce log noise
                         if i % 5 == 0 or i == max_to_check - 1:
                             print(f"Checking segments {i}-{min(i+4, max_to_check-1)}...")
                         
-                        response = session.get(segment_url, headers=headers, timeout=5, stream=True)
+                        response = session.get(segment_url, headers=headers, timeout=config.detect_timeout, stream=True)
                         
                         if response.status_code == 200:
                             # Verify it's actually a valid segment
@@ -356,12 +374,19 @@ class YandexDownloaderGUI:
                             
                             if is_valid:
                                 found_segments = i + 1
+                                if sizes is not None:
+                                    sizes[i] = downloader.content_length(response)
                             else:
                                 break
                         else:
                             break
                             
-                        time.sleep(0.1)
+                        if not config.detect_delay:
+                            continue
+                        if cancel_token:
+                            cancel_token.wait(config.detect_delay)
+                        else:
+                            time.sleep(config.detect_delay)
                         
                     except Exception as e:
                         break
@@ -375,7 +400,9 @@ class YandexDownloaderGUI:
             downloader.detect_segment_count = patched_detect_segment_count
             
             # Start download
-            success = downloader.download_video_from_pattern(base_url, max_segments, output_filename)
+            success = downloader.download_video_from_pattern(
+                base_url, max_segments, output_filename, config=config, cancel_token=self.cancel_token
+            )
             
             # Reset the functions
             downloader.print_progress_bar = original_print_progress
@@ -396,7 +423,7 @@ class YandexDownloaderGUI:
         if success:
             self.status_var.set("Download completed successfully!")
         else:
-            if downloader.cancelled:
+            if self.cancel_token and self.cancel_token.is_cancelled():
                 self.status_var.set("Download cancelled")
             else:
                 self.status_var.set("Download failed")
@@ -405,9 +432,8 @@ class YandexDownloaderGUI:
         
     def cancel_download(self):
         if self.download_thread and self.download_thread.is_alive():
-            # Set the cancellation flag in the downloader
-            with downloader.cancellation_lock:
-                downloader.cancelled = True
+            # Stops open transfers, queued segments and ffmpeg right away
+            self.cancel_token.cancel()
             self.status_var.set("Cancelling download...")
             self.cancel_btn.configure(state=tk.DISABLED)
             
@@ -419,9 +445,6 @@ class YandexDownloaderGUI:
         self.ffmpeg_entry.configure(state=tk.NORMAL)
         self.browse_btn.configure(state=tk.NORMAL)
         self.browse_ffmpeg_btn.configure(state=tk.NORMAL)
-        # Reset cancellation flag
-        with downloader.cancellation_lock:
-            downloader.cancelled = False
             
     def on_closing(self):
         # Cancel any running downloads
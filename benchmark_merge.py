@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import SimpleYandexDownloader as downloader
+
+def generate_segments(segments_dir, count, segment_seconds):
+    """Create synthetic TS segments (test pattern + tone) like the ones Yandex serves"""
+    print(f"🎞️  Generating {count} segments of {segment_seconds}s...")
+    ffmpeg_cmd = [
+        downloader.FFMPEG_PATH,
+        "-y",
+        "-f", "lavfi", "-i", "testsrc=size=1280x720:rate=25",
+        "-f", "lavfi", "-i", "sine=frequency=440",
+        "-t", str(count * segment_seconds),
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", str(segment_seconds * 25),
+        "-c:a", "aac",
+        "-f", "segment",
+        "-segment_time", str(segment_seconds),
+        "-segment_format", "mpegts",
+        os.path.join(segments_dir, "segment_%05d.ts")
+    ]
+    subprocess.run(ffmpeg_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+def merge_single_pass(segment_files, output_file, work_dir):
+    """The original approach: one ffmpeg -f concat -c copy over every segment"""
+    list_file = os.path.join(work_dir, "segments.txt")
+    with open(list_file, 'w') as f:
+        for filepath in segment_files:
+            f.write(f"file '{filepath}'\n")
+    ffmpeg_cmd = [
+        downloader.FFMPEG_PATH,
+        "-f", "concat",
+        "-safe", "0",
+        "-i", list_file,
+        "-c", "copy",
+        "-bsf:a", "aac_adtstoasc",
+        output_file
+    ]
+    return subprocess.run(ffmpeg_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+
+def merge_with_strategy(strategy, segment_files, output_file, work_dir):
+    """Merge already downloaded segments with one of the downloader's merge strategies"""
+    merger = downloader.create_merger(strategy, output_file, len(segment_files), work_dir)
+    merger.start()
+    for index, filepath in enumerate(segment_files):
+        merger.add_segment(index, filepath)
+    return merger.finish()
+
+def run_benchmark(segment_files, work_dir, repeat):
+    """Time every merge approach on the same segments and print a summary"""
+    approaches = [
+        ("single-pass concat", lambda out, tmp: merge_single_pass(segment_files, out, tmp)),
+        ("stream", lambda out, tmp: merge_with_strategy("stream", segment_files, out, tmp)),
+        ("chunked", lambda out, tmp: merge_with_strategy("chunked", segment_files, out, tmp)),
+    ]
+
+    results = []
+    for name, merge in approaches:
+        timings = []
+        for run in range(repeat):
+            run_dir = tempfile.mkdtemp(dir=work_dir)
+            output_file = os.path.join(run_dir, "output.mp4")
+            start = time.perf_counter()
+            returncode = merge(output_file, run_dir)
+            timings.append(time.perf_counter() - start)
+            if returncode != 0:
+                print(f"❌ {name} failed with exit code {returncode}")
+            shutil.rmtree(run_dir)
+        results.append((name, min(timings)))
+        print(f"⏱️  {name}: best of {repeat} = {min(timings):.2f}s")
+
+    baseline = results[0][1]
+    print()
+    print("📊 Results (relative to single-pass concat):")
+    for name, best in results:
+        print(f"   {name:<20} {best:8.2f}s  {baseline / best if best else 0:6.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare merge strategies on synthetic or existing segments")
+    parser.add_argument("--segments", type=int, default=1000, help="Number of synthetic segments to generate")
+    parser.add_argument("--segment-seconds", type=int, default=4, help="Length of each synthetic segment")
+    parser.add_argument("--segments-dir", help="Use existing segment_*.ts files instead of generating them")
+    parser.add_argument("--group-size", type=int, default=downloader.MERGE_GROUP_SIZE, help="Segments per chunk for the chunked strategy")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per approach, the best time is reported")
+    parser.add_argument("--ffmpeg", default=downloader.FFMPEG_PATH, help="Path to ffmpeg")
+    args = parser.parse_args()
+
+    downloader.FFMPEG_PATH = args.ffmpeg
+    downloader.MERGE_GROUP_SIZE = args.group_size
+
+    work_dir = tempfile.mkdtemp(prefix="merge_benchmark_")
+    try:
+        segments_dir = args.segments_dir
+        if not segments_dir:
+            segments_dir = os.path.join(work_dir, "segments")
+            os.makedirs(segments_dir)
+            generate_segments(segments_dir, args.segments, args.segment_seconds)
+
+        segment_files = sorted(
+            os.path.abspath(os.path.join(segments_dir, name))
+            for name in os.listdir(segments_dir) if name.endswith(".ts")
+        )
+        if not segment_files:
+            print("❌ No .ts segments found!")
+            sys.exit(1)
+
+        print(f"🔧 Benchmarking {len(segment_files)} segments ({os.cpu_count()} cores)")
+        run_benchmark(segment_files, work_dir, args.repeat)
+    finally:
+        shutil.rmtree(work_dir)
@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Builds the GUI window, draws it once and exits
+GUI_SNIPPET = (
+    "import tkinter as tk\n"
+    "import SimpleYandexDownloaderGUI as gui\n"
+    "root = tk.Tk()\n"
+    "gui.YandexDownloaderGUI(root)\n"
+    "root.update()\n"
+    "root.destroy()\n"
+)
+
+def time_cli_prompt(command):
+    """Time from launching the CLI until it shows the URL prompt"""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        command, cwd=HERE, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        env=dict(os.environ, PYTHONIOENCODING="utf-8", PYTHONUNBUFFERED="1")
+    )
+    output = b""
+    while b"Paste" not in output:
+        data = process.stdout.read1(4096)
+        if not data:
+            break
+        output += data
+    elapsed = time.perf_counter() - start
+    process.kill()
+    process.communicate()
+    return elapsed if b"Paste" in output else None
+
+def time_command(command):
+    """Time a command that exits by itself"""
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    elapsed = time.perf_counter() - start
+    return elapsed if result.returncode == 0 else None
+
+def report(name, measure, repeat):
+    """Run a measurement several times and print the best and median time"""
+    timings = []
+    for _ in range(repeat):
+        elapsed = measure()
+        if elapsed is None:
+            print(f"⚠️  {name}: could not be measured")
+            return
+        timings.append(elapsed)
+    timings.sort()
+    print(f"⏱️  {name}: best {timings[0] * 1000:.0f} ms, median {timings[len(timings) // 2] * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure how fast the CLI and GUI start")
+    parser.add_argument("--repeat", type=int, default=10, help="Runs per measurement")
+    parser.add_argument("--exe", help="Also time a packaged CLI executable until it shows the URL prompt")
+    args = parser.parse_args()
+
+    print(f"🚀 Startup benchmark ({args.repeat} runs each)")
+    report("Python interpreter only", lambda: time_command([sys.executable, "-c", "pass"]), args.repeat)
+    report("import SimpleYandexDownloader", lambda: time_command([sys.executable, "-c", "import SimpleYandexDownloader"]), args.repeat)
+    report("CLI until URL prompt", lambda: time_cli_prompt([sys.executable, "SimpleYandexDownloader.py"]), args.repeat)
+    report("GUI until window is drawn", lambda: time_command([sys.executable, "-c", GUI_SNIPPET]), args.repeat)
+    if args.exe:
+        report("Executable until URL prompt", lambda: time_cli_prompt([args.exe]), args.repeat)
@@ -4,6 +4,7 @@ import subprocess
 import shutil
 import platform
 import time
+import argparse
 
 def check_pyinstaller():
     """Check if PyInstaller is installed."""
@@ -18,8 +19,12 @@ def install_pyinstaller():
     print("Installing PyInstaller...")
     subprocess.run([sys.executable, "-m", "pip", "install", "pyinstaller"], check=True)
 
-def build_executable():
-    """Build the executable using PyInstaller."""
+def build_executable(onedir=False):
+    """Build the executable using PyInstaller.
+    
+    A --onefile build unpacks itself to a temp folder on every launch, a --onedir
+    build is already unpacked and starts noticeably faster.
+    """
     print("Building executable...")
     
     # Delete any existing build/dist directories
@@ -37,7 +42,7 @@ def build_executable():
     # Build command
     cmd = [
         "pyinstaller",
-        "--onefile",  # Create a single executable
+        "--onedir" if onedir else "--onefile",  # Folder with the executable, or a single executable
         "--noconsole",  # No console window
         "--name", "YandexVideoDownloader",
         "--add-data", "README.md" + os.pathsep + ".",  # Add README
@@ -47,9 +52,17 @@ def build_executable():
     subprocess.run(cmd, check=True)
     
     print("\nExecutable built successfully!")
-    print(f"You can find it in the 'dist' folder as YandexVideoDownloader{'exe' if system == 'windows' else ''}")
+    exe_name = f"YandexVideoDownloader{'.exe' if system == 'windows' else ''}"
+    if onedir:
+        print(f"You can find it in the 'dist/YandexVideoDownloader' folder as {exe_name} (distribute the whole folder)")
+    else:
+        print(f"You can find it in the 'dist' folder as {exe_name}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the Yandex Video Downloader executable")
+    parser.add_argument("--onedir", action="store_true", help="Build a folder instead of a single file (faster startup)")
+    args = parser.parse_args()
+    
     print("===== Building Yandex Video Downloader Executable =====")
     
     # Check and install PyInstaller if needed
@@ -58,7 +71,7 @@ if __name__ == "__main__":
         install_pyinstaller()
     
     # Build the executable
-    build_executable()
+    build_executable(onedir=args.onedir)
     
     print("\nBuild process completed!")
     print("Note: Make sure to distribute FFmpeg along with your executable, or instruct users to install it separately.")
@@ -0,0 +1,158 @@
+import os
+import re
+import sys
+import stat
+import threading
+import functools
+import http.server
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+import SimpleYandexDownloader as downloader
+
+SEGMENT_SECONDS = 2.0
+FRAME_RATE = 25
+
+def pts_bytes(pts):
+    """The 5 byte PTS field of a PES header"""
+    return bytes([
+        0x21 | ((pts >> 29) & 0x0E),
+        (pts >> 22) & 0xFF,
+        ((pts >> 14) & 0xFE) | 1,
+        (pts >> 7) & 0xFF,
+        ((pts << 1) & 0xFE) | 1,
+    ])
+
+def ts_packet(pid, stream_id, pts):
+    """A 188 byte MPEG-TS packet that starts a PES packet with a timestamp"""
+    pes = b'\x00\x00\x01' + bytes([stream_id]) + b'\x00\x00\x80\x80\x05' + pts_bytes(pts)
+    header = bytes([0x47, 0x40 | (pid >> 8), pid & 0xFF, 0x10])
+    return header + pes + b'\xff' * (188 - len(header) - len(pes))
+
+@functools.lru_cache(maxsize=None)
+def make_ts_segment(index, seconds=SEGMENT_SECONDS):
+    """Segment number index of a stream, with video frames and audio packets at the right timestamps"""
+    packets = []
+    start = int(index * seconds * 90000)
+    for frame in range(int(seconds * FRAME_RATE)):
+        pts = start + frame * 90000 // FRAME_RATE
+        packets.append(ts_packet(0x100, 0xE0, pts))
+        packets.append(ts_packet(0x101, 0xC0, pts))
+    return b''.join(packets)
+
+class SegmentServer:
+    """A local stand-in for the CDN that serves segments 0 to segment_count - 1
+
+    statuses maps a segment index to the responses for its first requests, e.g.
+    {3: [524, 524]} answers the first two requests for segment 3 with 524 and then
+    serves it normally. Besides status codes, "empty" sends a 200 without a body,
+    "short" a 200 with a body too small to be a segment and ("stall", seconds)
+    waits that long before sending the headers of a normal response. Every request
+    is recorded.
+    """
+
+    def __init__(self, segment_count, statuses=None, delay=0.0):
+        self.segment_count = segment_count
+        self.statuses = {index: list(responses) for index, responses in (statuses or {}).items()}
+        self.delay = delay
+        self.requests = []  # (index, status) in the order they arrived
+        self.lock = threading.Lock()
+
+        server = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.handle(self)
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        self.thread.start()
+
+    def url(self, index=0, vid="test"):
+        return f"http://127.0.0.1:{self.httpd.server_port}/video/{index}.ts?vid={vid}&token=abc"
+
+    def request_count(self, index=None):
+        with self.lock:
+            return sum(1 for i, _ in self.requests if index is None or i == index)
+
+    def handle(self, handler):
+        index = int(re.search(r'/(\d+)\.ts', handler.path).group(1))
+        with self.lock:
+            responses = self.statuses.get(index)
+            response = responses.pop(0) if responses else (200 if index < self.segment_count else 404)
+            self.requests.append((index, response))
+
+        if isinstance(response, tuple):
+            threading.Event().wait(response[1])
+            response = 200
+        if self.delay:
+            threading.Event().wait(self.delay)
+
+        if response == "empty":
+            body = b''
+        elif response == "short":
+            body = b'\x47' * 100
+        elif response == 200:
+            body = make_ts_segment(index)
+        else:
+            handler.send_response(response)
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return
+
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'video/mp2t')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture
+def segment_server():
+    """Start SegmentServer(segment_count, statuses, delay), stopped after the test"""
+    servers = []
+    def start(segment_count, statuses=None, delay=0.0):
+        server = SegmentServer(segment_count, statuses, delay)
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.stop()
+
+@pytest.fixture
+def session():
+    import requests
+    with requests.Session() as session:
+        yield session
+
+@pytest.fixture
+def ffmpeg_path(tmp_path):
+    """Path of an executable that runs fake_ffmpeg.py"""
+    script = os.path.join(HERE, "fake_ffmpeg.py")
+    if os.name == 'nt':
+        # CreateProcess runs .cmd files through cmd.exe, %* passes the arguments on
+        wrapper = tmp_path / "ffmpeg.cmd"
+        wrapper.write_text(f'@"{sys.executable}" "{script}" %*\n')
+        return str(wrapper)
+    wrapper = tmp_path / "ffmpeg"
+    wrapper.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+    wrapper.chmod(wrapper.stat().st_mode | stat.S_IXUSR)
+    return str(wrapper)
+
+@pytest.fixture
+def config(tmp_path, ffmpeg_path):
+    """Settings for fast jobs against the local server, writing into tmp_path/out"""
+    return downloader.Config(
+        ffmpeg_path=ffmpeg_path,
+        output_dir=str(tmp_path / "out"),
+        detect_delay=0.0,
+        retry_delay=0.0,
+        progress_interval=0.05,
+    )
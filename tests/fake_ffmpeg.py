@@ -0,0 +1,98 @@
+"""Stand-in for ffmpeg, so merging can be tested without installing it
+
+Understands the commands the downloader runs: "-version", remuxing segments
+from a pipe, a file or a concat list, and writing .ts chunks. MP4 output is
+a minimal ftyp/moov/mdat file whose duration is taken from the timestamps of
+the input, so the downloader's MP4 verification sees a realistic file.
+
+Set FAKE_FFMPEG_SHORT to a file path to write half the real duration once (the
+file is created to mark it as done) or to "always" for every merge, or
+FAKE_FFMPEG_FAIL=1 to exit with an error ("partial" writes part of the MP4
+first, like an ffmpeg that crashed halfway).
+"""
+import os
+import sys
+import struct
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import SimpleYandexDownloader as downloader
+
+def box(box_type, payload):
+    return struct.pack('>I', 8 + len(payload)) + box_type + payload
+
+def full_box(box_type, version, flags, payload):
+    return box(box_type, bytes([version]) + flags.to_bytes(3, 'big') + payload)
+
+def track(track_id, handler, timescale, seconds):
+    tkhd = full_box(b'tkhd', 0, 3, b'\0' * 8 + struct.pack('>I', track_id) + b'\0' * 64)
+    mdhd = full_box(b'mdhd', 0, 0, b'\0' * 8 + struct.pack('>II', timescale, int(seconds * timescale)) + b'\0' * 4)
+    hdlr = full_box(b'hdlr', 0, 0, b'\0' * 4 + handler + b'\0' * 13)
+    return box(b'trak', tkhd + box(b'mdia', mdhd + hdlr))
+
+def make_mp4(seconds, payload=b''):
+    """A minimal MP4 with a video and an audio track of the given duration"""
+    mvhd = full_box(b'mvhd', 0, 0, b'\0' * 8 + struct.pack('>II', 1000, int(seconds * 1000)) + b'\0' * 80)
+    moov = box(b'moov', mvhd + track(1, b'vide', 90000, seconds) + track(2, b'soun', 48000, seconds))
+    return box(b'ftyp', b'isom\0\0\0\0isom') + moov + box(b'mdat', payload)
+
+def read_input(args):
+    source = args[args.index('-i') + 1]
+    if source == 'pipe:0':
+        return sys.stdin.buffer.read()
+    if 'concat' in args:
+        data = b''
+        with open(source) as f:
+            for line in f:
+                # file '/path/to/segment.ts'
+                with open(line.strip()[6:-1], 'rb') as segment:
+                    data += segment.read()
+        return data
+    with open(source, 'rb') as f:
+        return f.read()
+
+def main(args):
+    if args == ['-version']:
+        print("ffmpeg version fake")
+        return 0
+    if os.environ.get('FAKE_FFMPEG_FAIL') == 'partial' and args[-1].endswith('.mp4'):
+        read_input(args)
+        with open(args[-1], 'wb') as f:
+            f.write(b'\0\0\0\x0eftypisom\0\0')
+        print("fake failure", file=sys.stderr)
+        return 1
+    if os.environ.get('FAKE_FFMPEG_FAIL') == '1':
+        print("fake failure", file=sys.stderr)
+        return 1
+
+    output_file = args[-1]
+    if '-n' in args and os.path.exists(output_file):
+        print(f"File '{output_file}' already exists. Exiting.", file=sys.stderr)
+        return 1
+    data = read_input(args)
+
+    # Intermediate chunks of the chunked merge stay MPEG-TS
+    if output_file.endswith('.ts'):
+        with open(output_file, 'wb') as f:
+            f.write(data)
+        return 0
+
+    fd, ts_file = tempfile.mkstemp(suffix='.ts')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    seconds = downloader.ts_duration(ts_file) or 0.0
+    os.remove(ts_file)
+
+    marker = os.environ.get('FAKE_FFMPEG_SHORT')
+    if marker == "always":
+        seconds /= 2
+    elif marker and not os.path.exists(marker):
+        open(marker, 'w').close()
+        seconds /= 2
+
+    with open(output_file, 'wb') as f:
+        f.write(make_mp4(seconds, data))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+import SimpleYandexDownloader as downloader
+
+def write_config(tmp_path, values):
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps(values))
+    return str(config_file)
+
+def test_defaults(tmp_path):
+    config = downloader.load_config(config_file=write_config(tmp_path, {}), environ={})
+    assert config == downloader.Config()
+
+def test_precedence(tmp_path):
+    config_file = write_config(tmp_path, {"profile": "datacenter", "max_workers": 4, "max_retries": 7, "chunk_size": 1024})
+    config = downloader.load_config(
+        config_file=config_file,
+        environ={"YANDEX_DL_MAX_RETRIES": "9", "YANDEX_DL_CHUNK_SIZE": "2048"},
+        overrides={"chunk_size": "4096"},
+    )
+    assert config.profile == "datacenter"
+    assert config.segment_timeout == 15.0  # profile
+    assert config.max_workers == 4  # file over profile
+    assert config.max_retries == 9  # environment over file
+    assert config.chunk_size == 4096  # command line over environment
+
+def test_custom_profile(tmp_path):
+    config_file = write_config(tmp_path, {"profiles": {"home": {"max_workers": 3, "hedge_requests": "no"}}})
+    config = downloader.load_config(config_file=config_file, profile="home", environ={})
+    assert config.max_workers == 3
+    assert config.hedge_requests is False
+
+@pytest.mark.parametrize("values", [
+    {"profile": "missing"},
+    {"unknown_setting": 1},
+    {"max_workers": "many"},
+    {"merge_strategy": "fast"},
+    {"max_workers": 0},
+    {"merge_group_size": 0},
+    {"max_retries": 0},
+    {"max_workers": 2.7},
+    {"max_workers": True},
+    {"retry_delay": -1},
+    {"segment_timeout": 0},
+    {"progress_interval": "nan"},
+    {"ffmpeg_path": None},
+    {"filename_template": "{bogus}.mp4"},
+    {"filename_template": "{n:d"},
+    {"profiles": [1, 2]},
+])
+def test_invalid_config(tmp_path, values):
+    with pytest.raises(ValueError):
+        downloader.load_config(config_file=write_config(tmp_path, values), environ={})
+
+def test_whole_float_is_accepted(tmp_path):
+    config = downloader.load_config(config_file=write_config(tmp_path, {"max_workers": 4.0}), environ={})
+    assert config.max_workers == 4
+
+def test_invalid_environment_value(tmp_path):
+    with pytest.raises(ValueError):
+        downloader.load_config(config_file=write_config(tmp_path, {}), environ={"YANDEX_DL_MAX_WORKERS": "0"})
+
+def test_config_file_must_be_an_object(tmp_path):
+    with pytest.raises(ValueError):
+        downloader.load_config(config_file=write_config(tmp_path, [1, 2]), environ={})
@@ -0,0 +1,75 @@
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+import SimpleYandexDownloader as downloader
+from conftest import make_ts_segment
+
+def gui_detect_segment_count(monkeypatch):
+    """The GUI's own detect_segment_count, which only exists while a GUI download runs"""
+    gui = pytest.importorskip("SimpleYandexDownloaderGUI")
+    captured = {}
+    def fake_download(*args, **kwargs):
+        captured['detect'] = downloader.detect_segment_count
+        return True
+    monkeypatch.setattr(downloader, "download_video_from_pattern", fake_download)
+    # The GUI resets sys.stdout when the download ends
+    monkeypatch.setattr(sys, "stdout", sys.stdout)
+
+    window = SimpleNamespace(
+        root=SimpleNamespace(after=lambda *args: None, update_idletasks=lambda: None),
+        cancel_token=None,
+    )
+    gui.YandexDownloaderGUI.download_thread_func(window, "http://example.invalid/0.ts", 200, "x.mp4", downloader.Config())
+    return captured['detect']
+
+@pytest.fixture(params=["cli", "gui"])
+def detect(request, monkeypatch):
+    """Both implementations of segment detection, they must behave the same"""
+    if request.param == "gui":
+        return gui_detect_segment_count(monkeypatch)
+    return downloader.detect_segment_count
+
+@pytest.fixture
+def fast_config():
+    return downloader.Config(detect_delay=0.0)
+
+def test_detects_last_segment(detect, segment_server, session, fast_config):
+    server = segment_server(7)
+    assert detect(server.url(), session, 200, config=fast_config) == 7
+
+def test_missing_first_segment(detect, segment_server, session, fast_config):
+    server = segment_server(0)
+    assert detect(server.url(), session, 200, config=fast_config) == 0
+    assert server.request_count() == 1
+
+def test_stops_at_max_limit(detect, segment_server, session, fast_config):
+    server = segment_server(50)
+    assert detect(server.url(), session, 10, config=fast_config) == 10
+    assert max(index for index, _ in server.requests) == 9
+
+def test_default_limit_comes_from_config(detect, segment_server, session):
+    server = segment_server(50)
+    config = downloader.Config(detect_delay=0.0, max_segments=12)
+    assert detect(server.url(), session, config=config) == 12
+
+@pytest.mark.parametrize("response", [404, 524, 500, "empty"])
+def test_first_bad_response_is_the_end(detect, segment_server, session, fast_config, response):
+    server = segment_server(20, statuses={5: [response]})
+    assert detect(server.url(), session, 200, config=fast_config) == 5
+    assert server.request_count(6) == 0
+
+def test_cancelled_detection_stops(detect, segment_server, session, fast_config):
+    server = segment_server(20)
+    token = downloader.CancellationToken()
+    token.cancel()
+    assert detect(server.url(), session, 200, cancel_token=token, config=fast_config) == 0
+    # Only the first segment is verified
+    assert server.request_count() == 1
+
+def test_records_segment_sizes(detect, segment_server, session, fast_config):
+    server = segment_server(4)
+    sizes = {}
+    assert detect(server.url(), session, 200, config=fast_config, sizes=sizes) == 4
+    assert sizes == {index: len(make_ts_segment(index)) for index in range(4)}
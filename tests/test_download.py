@@ -0,0 +1,222 @@
+import os
+import sys
+import hashlib
+import subprocess
+import threading
+import time
+from dataclasses import replace
+from types import SimpleNamespace
+
+import pytest
+
+import SimpleYandexDownloader as downloader
+from conftest import SEGMENT_SECONDS, make_ts_segment
+
+def temp_dir_for(config, server):
+    """The scratch folder a job for this server's video uses"""
+    video_id = downloader.get_video_id(server.url())
+    return os.path.join(config.output_dir, f"temp_{hashlib.sha1(video_id.encode()).hexdigest()[:12]}")
+
+@pytest.mark.parametrize("merge_strategy", ["stream", "chunked"])
+def test_downloads_and_merges(segment_server, config, merge_strategy):
+    server = segment_server(12)
+    config = replace(config, merge_strategy=merge_strategy, merge_group_size=5)
+    assert downloader.download_video_from_pattern(server.url(), output_filename="video.mp4", config=config)
+
+    output_file = os.path.join(config.output_dir, "video.mp4")
+    info = downloader.mp4_info(output_file)
+    assert info['duration'] == pytest.approx(12 * SEGMENT_SECONDS, abs=0.1)
+    assert [track['type'] for track in info['tracks']] == ["video", "audio"]
+    # The segments are only deleted once the video was verified
+    assert not os.path.exists(temp_dir_for(config, server))
+    assert downloader.find_existing_download(config.output_dir, "test")
+
+def test_resumes_from_kept_segments(segment_server, config):
+    server = segment_server(10)
+    temp_dir = temp_dir_for(config, server)
+    os.makedirs(temp_dir)
+    for index in range(5):
+        with open(os.path.join(temp_dir, f"segment_{index:05d}.ts"), 'wb') as f:
+            f.write(make_ts_segment(index))
+
+    assert downloader.download_video_from_pattern(server.url(), output_filename="video.mp4", config=config)
+    # Kept segments were only requested by the detection
+    for index in range(1, 5):
+        assert server.request_count(index) == 1
+    for index in range(5, 10):
+        assert server.request_count(index) == 2
+
+def test_failed_segment_is_skipped(segment_server, config):
+    # Found by the detection, then fails on every download attempt
+    server = segment_server(8, statuses={3: [200] + [500] * config.max_retries})
+    assert downloader.download_video_from_pattern(server.url(), output_filename="video.mp4", config=config)
+
+    info = downloader.mp4_info(os.path.join(config.output_dir, "video.mp4"))
+    # The missing segment leaves a gap, the video still covers the whole timeline
+    assert info['duration'] == pytest.approx(8 * SEGMENT_SECONDS, abs=0.1)
+    # Incomplete videos are not recorded, so they are downloaded again next time
+    assert downloader.find_existing_download(config.output_dir, "test") is None
+
+def test_short_merge_is_merged_again(segment_server, config, monkeypatch, tmp_path):
+    server = segment_server(6)
+    marker = tmp_path / "short_merge_done"
+    monkeypatch.setenv("FAKE_FFMPEG_SHORT", str(marker))
+    assert downloader.download_video_from_pattern(server.url(), output_filename="video.mp4", config=config)
+
+    assert marker.exists()
+    info = downloader.mp4_info(os.path.join(config.output_dir, "video.mp4"))
+    assert info['duration'] == pytest.approx(6 * SEGMENT_SECONDS, abs=0.1)
+    # Nothing was downloaded twice
+    assert server.request_count(3) == 2
+
+def test_bad_merge_is_renamed(segment_server, config, monkeypatch, capsys):
+    server = segment_server(4)
+    monkeypatch.setenv("FAKE_FFMPEG_SHORT", "always")
+    assert not downloader.download_video_from_pattern(server.url(), output_filename="video.mp4", config=config)
+    assert sorted(os.listdir(config.output_dir)) == sorted(["video.failed.mp4", os.path.basename(temp_dir_for(config, server))])
+    assert "Segments were kept in" in capsys.readouterr().out
+
+def test_bad_merge_of_drained_segments(segment_server, config, monkeypatch, capsys, tmp_path):
+    server = segment_server(4)
+    monkeypatch.setenv("FAKE_FFMPEG_SHORT", str(tmp_path / "short_merge_done"))
+    original_create_merger = downloader.create_merger
+    def create_merger(*args, **kwargs):
+        merger = original_create_merger(*args, **kwargs)
+        merger.drain_segments = True
+        return merger
+
+    monkeypatch.setattr(downloader, "create_merger", create_merger)
+    assert not downloader.download_video_from_pattern(server.url(), output_filename="video.mp4", config=config)
+    assert os.path.exists(os.path.join(config.output_dir, "video.failed.mp4"))
+    output = capsys.readouterr().out
+    assert "Segments were kept in" not in output
+    assert "already deleted" in output
+
+def test_failed_merge_keeps_segments(segment_server, config, monkeypatch):
+    server = segment_server(4)
+    monkeypatch.setenv("FAKE_FFMPEG_FAIL", "1")
+    assert not downloader.download_video_from_pattern(server.url(), output_filename="video.mp4", config=config)
+    assert sorted(name for name in os.listdir(temp_dir_for(config, server)) if name.endswith(".ts")) == [
+        f"segment_{index:05d}.ts" for index in range(4)
+    ]
+
+@pytest.mark.parametrize("merge_strategy", ["stream", "chunked"])
+def test_partial_merge_is_renamed(segment_server, config, monkeypatch, merge_strategy):
+    server = segment_server(4)
+    monkeypatch.setenv("FAKE_FFMPEG_FAIL", "partial")
+    config = replace(config, merge_strategy=merge_strategy)
+    assert not downloader.download_video_from_pattern(server.url(), output_filename="video.mp4", config=config)
+    assert not os.path.exists(os.path.join(config.output_dir, "video.mp4"))
+    assert os.path.getsize(os.path.join(config.output_dir, "video.failed.mp4")) == 14
+
+def test_vanished_segment_fails_the_merge(tmp_path, ffmpeg_path):
+    segment = tmp_path / "segment_00000.ts"
+    segment.write_bytes(make_ts_segment(0))
+    merger = downloader.create_merger("stream", str(tmp_path / "video.mp4"), 2, str(tmp_path), ffmpeg_path=ffmpeg_path)
+    merger.start()
+    merger.add_segment(0, str(segment))
+    merger.add_segment(1, str(tmp_path / "segment_00001.ts"))
+    assert merger.finish() != 0
+    assert "Feeding segments to ffmpeg failed" in merger.read_log()
+
+def test_already_downloaded_video_is_reused(segment_server, config):
+    server = segment_server(4)
+    assert downloader.download_video_from_pattern(server.url(), output_filename="first.mp4", config=config)
+    requests_made = server.request_count()
+
+    assert downloader.download_video_from_pattern(server.url(), output_filename="second.mp4", config=config)
+    assert server.request_count() == requests_made
+    first, second = (os.path.join(config.output_dir, name) for name in ("first.mp4", "second.mp4"))
+    assert downloader.file_sha256(first) == downloader.file_sha256(second)
+
+def test_cancelled_job_keeps_segments(segment_server, config, monkeypatch):
+    server = segment_server(20, delay=0.05)
+    token = downloader.CancellationToken()
+    # Cancel as soon as the first segment is handed to the merger
+    original_create_merger = downloader.create_merger
+    def create_merger(*args, **kwargs):
+        merger = original_create_merger(*args, **kwargs)
+        original_add_segment = merger.add_segment
+        def add_segment(index, filepath):
+            original_add_segment(index, filepath)
+            token.cancel()
+        merger.add_segment = add_segment
+        return merger
+
+    monkeypatch.setattr(downloader, "create_merger", create_merger)
+    assert not downloader.download_video_from_pattern(server.url(), output_filename="video.mp4", config=config, cancel_token=token)
+    assert not os.path.exists(os.path.join(config.output_dir, "video.mp4"))
+    assert any(name.endswith(".ts") for name in os.listdir(temp_dir_for(config, server)))
+
+def test_failed_job_releases_reserved_name(segment_server, config, monkeypatch):
+    server = segment_server(4)
+    monkeypatch.setenv("FAKE_FFMPEG_FAIL", "1")
+    output_filename = downloader.get_next_filename(config.output_dir)
+    assert not downloader.download_video_from_pattern(server.url(), output_filename=output_filename, config=config)
+    assert not os.path.exists(os.path.join(config.output_dir, output_filename))
+
+def test_existing_output_gets_fresh_name(segment_server, config):
+    server = segment_server(4)
+    os.makedirs(config.output_dir)
+    with open(os.path.join(config.output_dir, "video.mp4"), 'wb') as f:
+        f.write(b'my own video')
+    assert downloader.download_video_from_pattern(server.url(), output_filename="video.mp4", config=config)
+    with open(os.path.join(config.output_dir, "video.mp4"), 'rb') as f:
+        assert f.read() == b'my own video'
+    assert downloader.mp4_info(os.path.join(config.output_dir, "video_2.mp4"))
+
+def test_index_updates_from_several_processes(tmp_path):
+    video = tmp_path / "video.mp4"
+    video.write_bytes(b'video')
+    script = (
+        "import sys; sys.path.insert(0, sys.argv[1]); import SimpleYandexDownloader as d\n"
+        "for i in range(10): d.record_download(sys.argv[2], f'{sys.argv[3]}-{i}', 1, 5, sys.argv[4])\n"
+    )
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    processes = [
+        subprocess.Popen([sys.executable, "-c", script, repo, str(tmp_path), f"job{job}", str(video)])
+        for job in range(4)
+    ]
+    assert all(process.wait() == 0 for process in processes)
+    assert len(downloader.load_download_index(str(tmp_path))) == 40
+
+def test_hedge_replaces_request_stuck_before_headers(segment_server, config):
+    # Segment 20 is found by the detection, then its download hangs before the headers
+    server = segment_server(30, statuses={20: [200, ("stall", 8)]})
+    config = replace(config, hedge_requests=True)
+    start = time.perf_counter()
+    assert downloader.download_video_from_pattern(server.url(), output_filename="video.mp4", config=config)
+    assert time.perf_counter() - start < 5
+    assert server.request_count(20) == 3
+
+def test_cancel_cuts_off_requests_waiting_for_headers(segment_server, config):
+    server = segment_server(10, statuses={index: [200, ("stall", 10)] for index in range(1, 10)})
+    token = downloader.CancellationToken()
+    threading.Timer(1.0, token.cancel).start()
+    assert not downloader.download_video_from_pattern(server.url(), output_filename="video.mp4", config=config, cancel_token=token)
+    assert token.seconds_since_cancel() < 1
+
+def test_jobs_sharing_a_token_leave_no_callbacks(segment_server, config):
+    server = segment_server(4)
+    token = downloader.CancellationToken()
+    config = replace(config, reuse_existing=None)
+    for job in range(3):
+        assert downloader.download_video_from_pattern(server.url(), output_filename=f"video{job}.mp4", config=config, cancel_token=token)
+    assert token.callbacks == []
+
+def test_live_capture_is_not_reused(segment_server, config):
+    server = segment_server(4)
+    assert downloader.download_video_from_pattern(server.url(), output_filename="live.mp4", config=config, follow=True, follow_timeout=0.2)
+    assert downloader.find_existing_download(config.output_dir, "test") is None
+
+    requests_made = server.request_count()
+    assert downloader.download_video_from_pattern(server.url(), output_filename="video.mp4", config=config)
+    assert server.request_count() > requests_made
+
+@pytest.mark.parametrize("merge_strategy, warned", [("stream", False), ("chunked", True)])
+def test_disk_check_counts_the_chunks(tmp_path, monkeypatch, capsys, merge_strategy, warned):
+    # Scratch and output on the same drive, with room for 2.5 copies of the video
+    mb = 1024 * 1024
+    monkeypatch.setattr(downloader.shutil, "disk_usage", lambda path: SimpleNamespace(free=250 * mb))
+    assert downloader.check_disk_space(str(tmp_path), str(tmp_path), 100 * mb, 0, merge_strategy)
+    assert ("Only 250 MB free" in capsys.readouterr().out) is warned
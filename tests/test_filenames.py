@@ -0,0 +1,84 @@
+import os
+import time
+import threading
+
+import pytest
+
+import SimpleYandexDownloader as downloader
+
+def test_numbers_increase(tmp_path):
+    assert downloader.get_next_filename(str(tmp_path)) == "downloaded_001.mp4"
+    assert downloader.get_next_filename(str(tmp_path)) == "downloaded_002.mp4"
+
+def test_continues_after_existing_downloads(tmp_path):
+    (tmp_path / "downloaded_007.mp4").write_bytes(b'')
+    assert downloader.get_next_filename(str(tmp_path)) == "downloaded_008.mp4"
+
+def test_skips_files_added_by_hand(tmp_path):
+    assert downloader.get_next_filename(str(tmp_path)) == "downloaded_001.mp4"
+    (tmp_path / "downloaded_002.mp4").write_bytes(b'')
+    assert downloader.get_next_filename(str(tmp_path)) == "downloaded_003.mp4"
+
+def test_template_without_number(tmp_path):
+    template = "{video_id}.mp4"
+    assert downloader.get_next_filename(str(tmp_path), template, video_id="abc/123") == "abc_123.mp4"
+    (tmp_path / "abc_123.mp4").write_bytes(b'')
+    assert downloader.get_next_filename(str(tmp_path), template, video_id="abc/123") == "abc_123_2.mp4"
+
+def test_concurrent_jobs_get_different_names(tmp_path):
+    names = []
+    lock = threading.Lock()
+    def worker():
+        for _ in range(5):
+            name = downloader.get_next_filename(str(tmp_path))
+            with lock:
+                names.append(name)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(names)) == 40
+
+def test_concurrent_jobs_get_different_names_without_number(tmp_path):
+    names = []
+    lock = threading.Lock()
+    def worker():
+        name = downloader.get_next_filename(str(tmp_path), "{video_id}.mp4", video_id="abc")
+        with lock:
+            names.append(name)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(names) == ["abc.mp4", "abc_2.mp4", "abc_3.mp4", "abc_4.mp4"]
+
+def test_name_is_reserved(tmp_path):
+    name = downloader.get_next_filename(str(tmp_path), "{video_id}.mp4", video_id="abc")
+    assert (tmp_path / name).exists()
+    assert (tmp_path / name).stat().st_size == 0
+
+def test_stale_lock_is_broken(tmp_path):
+    lock_file = tmp_path / "counter.lock"
+    lock_file.write_text("12345")
+    os.utime(lock_file, (time.time() - 60, time.time() - 60))
+    with downloader.file_lock(str(lock_file), timeout=1):
+        assert lock_file.read_text() == str(os.getpid())
+    assert os.listdir(tmp_path) == []
+
+def test_fresh_lock_is_not_broken(tmp_path):
+    lock_file = tmp_path / "counter.lock"
+    lock_file.write_text("12345")
+    # Another waiter saw the old lock as stale, but it was replaced by a fresh one since
+    downloader.break_stale_lock(str(lock_file), stale_after=30)
+    assert lock_file.read_text() == "12345"
+    assert os.listdir(tmp_path) == ["counter.lock"]
+
+def test_unusable_folder_raises_oserror(tmp_path):
+    # Callers report OSError instead of crashing
+    (tmp_path / "not_a_folder").write_bytes(b'')
+    with pytest.raises(OSError):
+        downloader.get_next_filename(str(tmp_path / "not_a_folder"))
@@ -0,0 +1,9 @@
+import SimpleYandexDownloader as downloader
+
+def test_regular_file_is_not_read_as_a_pipe(tmp_path, capsys):
+    pipe = tmp_path / "urls"
+    pipe.write_text("http://example.invalid/video/0.ts?vid=abc\n")
+    queue = downloader.DownloadQueue(downloader.Config(), downloader.CancellationToken())
+    downloader.read_named_pipe(str(pipe), queue, downloader.CancellationToken())
+    assert queue.jobs.empty()
+    assert "is not a named pipe" in capsys.readouterr().out
@@ -0,0 +1,41 @@
+"""Budgets that catch regressions in request count and job time
+
+The wall-clock budget is generous on purpose: a 500 segment job against the
+local server takes a few seconds, the budget only fails on real slowdowns
+such as a sleep per segment or a serial bottleneck.
+"""
+import os
+import time
+from dataclasses import replace
+
+import SimpleYandexDownloader as downloader
+
+JOB_SEGMENTS = 500
+JOB_BUDGET_SECONDS = 30.0
+
+def test_detection_request_count(segment_server, session):
+    server = segment_server(60)
+    config = downloader.Config(detect_delay=0.0)
+    assert downloader.detect_segment_count(server.url(), session, 200, config=config) == 60
+    # First segment verified, every segment checked once, plus the one that isn't there
+    assert server.request_count() == 60 + 2
+
+def test_detection_request_count_at_limit(segment_server, session):
+    server = segment_server(60)
+    config = downloader.Config(detect_delay=0.0)
+    assert downloader.detect_segment_count(server.url(), session, 25, config=config) == 25
+    assert server.request_count() == 25 + 1
+
+def test_synthetic_job_budget(segment_server, config):
+    server = segment_server(JOB_SEGMENTS)
+    config = replace(config, max_segments=2 * JOB_SEGMENTS, max_workers=8, hedge_requests=False)
+
+    start = time.perf_counter()
+    assert downloader.download_video_from_pattern(server.url(), output_filename="video.mp4", config=config)
+    elapsed = time.perf_counter() - start
+
+    assert os.path.exists(os.path.join(config.output_dir, "video.mp4"))
+    assert elapsed < JOB_BUDGET_SECONDS, f"{JOB_SEGMENTS} segments took {elapsed:.1f}s"
+    # Detection and one download per segment, the size estimate reuses the detection's responses
+    assert server.request_count() == (JOB_SEGMENTS + 2) + JOB_SEGMENTS
+    assert all(server.request_count(index) == 2 for index in range(1, JOB_SEGMENTS))
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+import SimpleYandexDownloader as downloader
+from conftest import make_ts_segment
+
+@pytest.fixture
+def fetch(tmp_path, session):
+    """Download one segment with download_segment_with_retry, returns its path or None"""
+    def fetch(server, index=0, config=None, cancel_token=None, progress=None):
+        args = (
+            index, server.url(index), str(tmp_path), session,
+            cancel_token or downloader.CancellationToken(), None, None, progress,
+            config or downloader.Config(retry_delay=0.0),
+        )
+        return downloader.download_segment_with_retry(args)
+    return fetch
+
+def test_downloads_segment(fetch, segment_server, tmp_path):
+    server = segment_server(3)
+    filepath = fetch(server, 2)
+    assert filepath == str(tmp_path / "segment_00002.ts")
+    with open(filepath, 'rb') as f:
+        assert f.read() == make_ts_segment(2)
+    assert not os.path.exists(filepath + ".part")
+
+def test_missing_segment_is_not_retried(fetch, segment_server, tmp_path):
+    server = segment_server(3)
+    assert fetch(server, 5) is None
+    assert server.request_count() == 1
+    assert os.listdir(tmp_path) == []
+
+def test_timeout_is_retried(fetch, segment_server):
+    server = segment_server(3, statuses={0: [524, 524]})
+    assert fetch(server) is not None
+    assert server.request_count() == 3
+
+@pytest.mark.parametrize("response", [524, 500, "short"])
+def test_gives_up_after_max_retries(fetch, segment_server, tmp_path, response):
+    server = segment_server(3, statuses={0: [response] * 10})
+    config = downloader.Config(retry_delay=0.0, max_retries=4)
+    assert fetch(server, config=config) is None
+    assert server.request_count() == 4
+    assert not os.path.exists(tmp_path / "segment_00000.ts")
+
+def test_existing_segment_is_reused(fetch, segment_server, tmp_path):
+    server = segment_server(3)
+    (tmp_path / "segment_00001.ts").write_bytes(make_ts_segment(1))
+    assert fetch(server, 1) == str(tmp_path / "segment_00001.ts")
+    assert server.request_count() == 0
+
+def test_partial_file_is_downloaded_again(fetch, segment_server, tmp_path):
+    server = segment_server(3)
+    # Left behind by a cancelled download
+    (tmp_path / "segment_00001.ts.part").write_bytes(make_ts_segment(1)[:5000])
+    filepath = fetch(server, 1)
+    assert server.request_count() == 1
+    with open(filepath, 'rb') as f:
+        assert f.read() == make_ts_segment(1)
+
+def test_cancelled_token_skips_download(fetch, segment_server):
+    server = segment_server(3)
+    token = downloader.CancellationToken()
+    token.cancel()
+    assert fetch(server, cancel_token=token) is None
+    assert server.request_count() == 0
+
+def test_kept_segment_counts_toward_total_not_rate(fetch, segment_server, tmp_path):
+    server = segment_server(3)
+    (tmp_path / "segment_00001.ts").write_bytes(make_ts_segment(1))
+    progress = downloader.ProgressTracker(3)
+    progress.last_time = 0
+    fetch(server, 1, progress=progress)
+    assert progress.bytes == len(make_ts_segment(1))
+    progress.update_rate()
+    assert progress.rate == 0
+
+def test_failed_attempt_bytes_are_taken_back(fetch, segment_server):
+    server = segment_server(3, statuses={0: ["short", "short"]})
+    progress = downloader.ProgressTracker(3)
+    assert fetch(server, progress=progress) is not None
+    assert progress.bytes == len(make_ts_segment(0))
@@ -0,0 +1,64 @@
+import struct
+
+import pytest
+
+import SimpleYandexDownloader as downloader
+from conftest import make_ts_segment
+from fake_ffmpeg import box, full_box, make_mp4, track
+
+def fragmented_mp4(fragment_count, samples_per_fragment=50, sample_duration=3600):
+    """Fragmented MP4 like the one written for live streams, with an empty moov"""
+    mvhd = full_box(b'mvhd', 0, 0, b'\0' * 8 + struct.pack('>II', 1000, 0) + b'\0' * 80)
+    trex = full_box(b'trex', 0, 0, struct.pack('>IIIII', 1, 1, sample_duration, 0, 0))
+    moov = box(b'moov', mvhd + track(1, b'vide', 90000, 0) + box(b'mvex', trex))
+    data = box(b'ftyp', b'isom\0\0\0\0isom') + moov
+    for fragment in range(fragment_count):
+        tfhd = full_box(b'tfhd', 0, 0x20000, struct.pack('>I', 1))
+        tfdt = full_box(b'tfdt', 1, 0, struct.pack('>Q', fragment * samples_per_fragment * sample_duration))
+        if fragment % 2:
+            # Per sample durations and sizes
+            samples = struct.pack('>II', sample_duration, 10) * samples_per_fragment
+            trun = full_box(b'trun', 0, 0x301, struct.pack('>Ii', samples_per_fragment, 0) + samples)
+        else:
+            # Default duration from trex
+            trun = full_box(b'trun', 0, 0x1, struct.pack('>Ii', samples_per_fragment, 0))
+        moof = box(b'moof', box(b'mfhd', b'\0' * 8) + box(b'traf', tfhd + tfdt + trun))
+        data += moof + box(b'mdat', b'\0' * 100)
+    return data
+
+def test_ts_duration(tmp_path):
+    segment = tmp_path / "segment.ts"
+    segment.write_bytes(make_ts_segment(7))
+    assert downloader.ts_duration(str(segment)) == pytest.approx(2.0)
+
+def test_mp4_info(tmp_path):
+    video = tmp_path / "video.mp4"
+    video.write_bytes(make_mp4(123.4, b'\0' * 1000))
+    info = downloader.mp4_info(str(video))
+    assert info['duration'] == pytest.approx(123.4)
+    assert [(track['id'], track['type']) for track in info['tracks']] == [(1, "video"), (2, "audio")]
+
+def test_mp4_info_fragmented(tmp_path):
+    video = tmp_path / "live.mp4"
+    video.write_bytes(fragmented_mp4(5))
+    # 5 fragments of 50 frames at 25 fps
+    assert downloader.mp4_info(str(video))['duration'] == pytest.approx(10.0)
+
+def test_truncated_mp4(tmp_path):
+    video = tmp_path / "video.mp4"
+    video.write_bytes(make_mp4(10.0, b'\0' * 1000)[:-10])
+    assert downloader.mp4_info(str(video)) is None
+    assert downloader.verify_output(str(video), 10.0)[0] is False
+
+@pytest.mark.parametrize("actual, expected, allow_longer, ok", [
+    (100.0, 100.3, False, True),
+    (100.0, 90.0, False, False),
+    (50.0, 100.0, False, False),
+    (100.0, 90.0, True, True),
+    (50.0, 100.0, True, False),
+    (100.0, None, False, True),
+])
+def test_verify_output(tmp_path, actual, expected, allow_longer, ok):
+    video = tmp_path / "video.mp4"
+    video.write_bytes(make_mp4(actual))
+    assert downloader.verify_output(str(video), expected, allow_longer)[0] is ok